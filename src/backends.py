@@ -0,0 +1,293 @@
+"""Pluggable DDA backends of the batch casting path.
+A backend casts a batch of rays with the signature and results of
+vectorized.run_along_rays:
+    "python"    raycaster.run_along_ray once per ray, the reference
+    "numpy"     vectorized.run_along_rays, every ray is advanced in lockstep
+    "numba"     a compiled loop over the rays on the flat grid array, every
+                ray stops as soon as it is done instead of waiting for the
+                longest one. Needs numba and a DenseGrid, it falls back to
+                numpy otherwise. The compiled code is cached on disk.
+constants.BACKEND picks the backend, "auto" takes numba when it is installed.
+march gives the variant of vectorized.march_rays that also returns the tile
+that was hit, for line of sight queries and batched cameras.
+"""
+from __future__ import annotations
+
+import math
+import warnings
+
+import numpy as np
+
+import constants
+import numerical
+import vectorized
+from profiler import PROFILER
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _march_kernel(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    max_distance,
+    cells,
+    rows,
+    cols,
+    field,
+    dist,
+    side,
+    element,
+    steps,
+    cell_x,
+    cell_y,
+):
+    """DDA of vectorized.march_rays one ray at a time over the flat <cells>
+    of a rows x cols grid, with the same float tolerances and the same
+    empty space skipping over the flat distance <field> (empty to disable).
+    The results are written into <dist>, <side>, <element>, <steps> and
+    the tile that was hit into <cell_x> and <cell_y>.
+    Plain Python, compiled with numba when it is installed."""
+    rel_tol = numerical.REL_TOL
+    inf = math.inf
+    for i in range(ray_x.size):
+        (ox, oy, rx, ry) = (origin_x[i], origin_y[i], ray_x[i], ray_y[i])
+        delta_x = abs(1 / rx) if rx != 0 else inf
+        delta_y = abs(1 / ry) if ry != 0 else inf
+        map_x = int(ox)
+        map_y = int(oy)
+        step_x = -1 if rx < -numerical.ABS_TOL else 1
+        step_y = -1 if ry < -numerical.ABS_TOL else 1
+        side_x = ((ox - map_x) if step_x < 0 else (map_x + 1.0 - ox)) * delta_x
+        side_y = ((oy - map_y) if step_y < 0 else (map_y + 1.0 - oy)) * delta_y
+        count = 0
+        while True:
+            count += 1
+            inside = 0 <= map_x < rows and 0 <= map_y < cols
+            if field.size and inside and field[map_x * cols + map_y] >= 3:
+                # vectorized._skip_empty for this ray
+                reach = field[map_x * cols + map_y] - 1
+                last_x = side_x + (reach - 1) * delta_x
+                last_y = side_y + (reach - 1) * delta_y
+                if last_x != last_x or last_y != last_y:
+                    limit = math.nan
+                else:
+                    limit = min(last_x, last_y)
+                cross_x = np.floor((limit - side_x) / delta_x) + 1
+                cross_y = np.floor((limit - side_y) / delta_y) + 1
+                cross_x = int(min(cross_x, reach)) if cross_x > 0 else 0
+                cross_y = int(min(cross_y, reach)) if cross_y > 0 else 0
+                if cross_x > 0:
+                    side_x += cross_x * delta_x
+                if cross_y > 0:
+                    side_y += cross_y * delta_y
+                map_x += cross_x * step_x
+                map_y += cross_y * step_y
+            # walk_along_ray with numerical.array_is_below
+            gap = side_y - side_x
+            if side_x < side_y and (
+                gap > rel_tol * max(abs(side_x), abs(side_y)) or gap == inf
+            ):
+                side_x += delta_x
+                entry = side_x - delta_x
+                map_x += step_x
+                hit_side = 0
+            else:
+                side_y += delta_y
+                entry = side_y - delta_y
+                map_y += step_y
+                hit_side = 1
+            lost = (
+                not entry <= max_distance[i]
+                or (map_x < 0 and step_x < 0)
+                or (map_x >= rows and step_x > 0)
+                or (map_y < 0 and step_y < 0)
+                or (map_y >= cols and step_y > 0)
+            )
+            if lost:
+                break
+            if 0 <= map_x < rows and 0 <= map_y < cols:
+                cell = cells[map_x * cols + map_y]
+                if cell > 0:
+                    dist[i] = entry
+                    side[i] = hit_side
+                    element[i] = cell
+                    cell_x[i] = map_x
+                    cell_y[i] = map_y
+                    break
+        steps[i] = count
+
+
+# compiled on first use, with IEEE float semantics like numpy and without
+# holding the GIL, so a render thread casts while the main thread draws
+_kernel = None
+if numba is not None:
+    _kernel = numba.njit(cache=True, error_model="numpy", nogil=True)(_march_kernel)
+
+
+def run_along_rays_python(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    grid,
+    max_distance=constants.VIEW_DISTANCE,
+    field=None,
+) -> vectorized.Columns:
+    """Backend that runs raycaster.run_along_ray for every ray, <field> is
+    not used."""
+    import raycaster
+
+    ray_x = np.asarray(ray_x, dtype=float)
+    ray_y = np.asarray(ray_y, dtype=float)
+    values = [
+        np.broadcast_to(np.asarray(value, dtype=float), ray_x.shape).ravel().tolist()
+        for value in (origin_x, origin_y, max_distance)
+    ]
+    results = [
+        raycaster.run_along_ray(
+            constants.Point2(ox, oy), constants.Point2(rx, ry), grid, limit
+        )
+        for ox, oy, rx, ry, limit in zip(
+            values[0],
+            values[1],
+            ray_x.ravel().tolist(),
+            ray_y.ravel().tolist(),
+            values[2],
+        )
+    ]
+    (dist, side, element, steps) = zip(*results) if results else ((), (), (), ())
+    return vectorized.Columns(
+        np.array(dist, dtype=float).reshape(ray_x.shape),
+        np.array(side, dtype=np.int8).reshape(ray_x.shape),
+        np.array(element, dtype=np.int16).reshape(ray_x.shape),
+        np.array(steps, dtype=int).reshape(ray_x.shape),
+    )
+
+
+def march_rays_numba(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    grid,
+    max_distance=constants.VIEW_DISTANCE,
+    field=None,
+    kernel=None,
+) -> vectorized.Hits:
+    """vectorized.march_rays with the compiled DDA kernel over the flat array
+    of a DenseGrid, vectorized.march_rays without numba or for other grids.
+    <kernel> replaces the compiled kernel, e.g. with the uncompiled one."""
+    kernel = _kernel if kernel is None else kernel
+    if kernel is None or not hasattr(grid, "array"):
+        return vectorized.march_rays(
+            origin_x, origin_y, ray_x, ray_y, grid, max_distance, field
+        )
+    ray_x = np.asarray(ray_x, dtype=float)
+    ray_y = np.asarray(ray_y, dtype=float)
+    shape = np.broadcast_shapes(ray_x.shape, ray_y.shape)
+    (origin_x, origin_y, ray_x, ray_y, max_distance) = (
+        np.ascontiguousarray(
+            np.broadcast_to(np.asarray(value, dtype=float), shape).ravel()
+        )
+        for value in (origin_x, origin_y, ray_x, ray_y, max_distance)
+    )
+    array = grid.array
+    # a flat array of zero length disables skipping
+    flat_field = np.zeros(0, dtype=np.uint8) if field is None else field.values.ravel()
+    dist = np.full(ray_x.size, np.inf)
+    side = np.full(ray_x.size, -1, dtype=np.int8)
+    element = np.zeros(ray_x.size, dtype=np.int16)
+    steps = np.zeros(ray_x.size, dtype=np.int64)
+    cell_x = np.full(ray_x.size, -1, dtype=np.int64)
+    cell_y = np.full(ray_x.size, -1, dtype=np.int64)
+    kernel(
+        origin_x,
+        origin_y,
+        ray_x,
+        ray_y,
+        max_distance,
+        np.ascontiguousarray(array).ravel(),
+        array.shape[0],
+        array.shape[1],
+        flat_field,
+        dist,
+        side,
+        element,
+        steps,
+        cell_x,
+        cell_y,
+    )
+    return vectorized.Hits(
+        *(
+            values.reshape(shape)
+            for values in (dist, side, element, steps, cell_x, cell_y)
+        )
+    )
+
+
+def run_along_rays_numba(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    grid,
+    max_distance=constants.VIEW_DISTANCE,
+    field=None,
+    kernel=None,
+) -> vectorized.Columns:
+    """Backend that runs the compiled DDA kernel, see march_rays_numba."""
+    hits = march_rays_numba(
+        origin_x, origin_y, ray_x, ray_y, grid, max_distance, field, kernel
+    )
+    PROFILER.count("rays", hits.dist.size)
+    PROFILER.count("dda_steps", int(hits.steps.sum()))
+    return vectorized.Columns(*hits[:4])
+
+
+BACKENDS = {
+    "python": run_along_rays_python,
+    "numpy": vectorized.run_along_rays,
+    "numba": run_along_rays_numba,
+}
+
+
+# backends that also return the tile that was hit, see march
+MARCHERS = {
+    "numpy": vectorized.march_rays,
+    "numba": march_rays_numba,
+}
+
+
+def available() -> list:
+    """Names of the backends that can run here."""
+    return [name for name in BACKENDS if name != "numba" or _kernel is not None]
+
+
+def resolve(name=None) -> str:
+    """Name of the backend that runs for <name>, constants.BACKEND by default.
+    "auto" is numba when it is installed and numpy otherwise, numba falls
+    back to numpy with a warning when it is not installed."""
+    name = constants.BACKEND if name is None else name
+    if name == "auto":
+        name = "numba" if _kernel is not None else "numpy"
+    if name == "numba" and _kernel is None:
+        warnings.warn("numba is not installed, casting with numpy")
+        name = "numpy"
+    assert name in BACKENDS, f"Unknown backend {name}!"
+    return name
+
+
+def get(name=None):
+    """Backend function of <name>, see resolve."""
+    return BACKENDS[resolve(name)]
+
+
+def march(name=None):
+    """vectorized.march_rays of the backend <name>, see resolve. The python
+    backend does not track tiles and marches with numpy."""
+    return MARCHERS.get(resolve(name), vectorized.march_rays)
@@ -0,0 +1,176 @@
+"""Headless benchmark suite for the raycasting core.
+Runs scripted camera paths over grid.GRID and over synthetic large maps
+at several resolutions and STEP values and reports rays/sec,
+DDA steps/sec and frame time percentiles. No window is opened.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 256 1024 --widths 600 1920 --steps 1 2 --json out.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+import backends
+import constants
+import functions
+import grid
+import raycaster
+from chunked_map import ChunkedGrid
+from dense_grid import DenseGrid
+
+
+def synthetic_grid(size, density=0.05, seed=0) -> DenseGrid:
+    """Construct a square <size> grid surrounded by walls with
+    roughly <density> of the inner tiles filled with random walls."""
+    rng = np.random.default_rng(seed)
+    elements = np.array(sorted(constants.INT_TO_COLOR))
+    array = rng.choice(elements, size=(size, size)).astype(np.uint8)
+    array[rng.random((size, size)) >= density] = 0
+    # close the map so every ray eventually collides
+    array[[0, -1], :] = elements[0]
+    array[:, [0, -1]] = elements[0]
+    return DenseGrid(array, read_only=True)
+
+
+def camera_path(grid, frames, seed=0):
+    """Scripted camera path. Yields (origin, direction, plane) for <frames> frames.
+    The camera walks forward while turning, and turns away from walls."""
+    rng = np.random.default_rng(seed)
+    # start on a random empty tile
+    while True:
+        (x, y) = rng.integers(0, grid.shape)
+        if grid[(x, y)] == 0:
+            break
+    (x, y) = (x + 0.5, y + 0.5)
+    direction = constants.Point2(1, 0)
+    plane = constants.Point2(0, 0.66)
+    turn = math.radians(2)
+    for _ in range(frames):
+        yield constants.Point2(x, y), direction, plane
+        (nx, ny) = (x + direction.x * 0.25, y + direction.y * 0.25)
+        if grid[(int(nx), int(ny))] == 0:
+            (x, y) = (nx, ny)
+        else:
+            # turn harder when blocked
+            direction = constants.Point2(*functions.rotate_by_step(direction, 10 * turn))
+            plane = constants.Point2(*functions.rotate_by_step(plane, 10 * turn))
+        direction = constants.Point2(*functions.rotate_by_step(direction, turn))
+        plane = constants.Point2(*functions.rotate_by_step(plane, turn))
+
+
+def run_benchmark(
+    grid, width, step=1, frames=60, batch=True, seed=0, backend=None
+) -> dict:
+    """Cast <frames> frames of camera_path over <grid> and time every frame.
+    The batch path casts with <backend>, see backends.get. The first frame is
+    cast once untimed, so one time setup like loading the compiled kernel or
+    building the distance field is not counted."""
+    frame_times = []
+    rays = 0
+    steps = 0
+    poses = list(camera_path(grid, frames, seed))
+    if poses:
+        raycaster.cast_columns(
+            *poses[0], grid, width, step, batch=batch, backend=backend
+        )
+    for origin, direction, plane in poses:
+        start = time.perf_counter()
+        columns = raycaster.cast_columns(
+            origin, direction, plane, grid, width, step, batch=batch, backend=backend
+        )
+        frame_times.append(time.perf_counter() - start)
+        rays += len(columns.dist)
+        steps += int(columns.steps.sum())
+    total = sum(frame_times)
+    (p50, p95, p99) = np.percentile(np.array(frame_times) * 1e3, [50, 95, 99])
+    return {
+        "map": f"{grid.shape[0]}x{grid.shape[1]}",
+        "width": width,
+        "step": step,
+        "engine": backend or ("batch" if batch else "column"),
+        "frames": frames,
+        "rays_per_sec": rays / total,
+        "steps_per_sec": steps / total,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+
+
+def run_suite(sizes, widths, steps, frames, engines, seed=0, maps=()) -> list:
+    """Run run_benchmark for every combination of map, width, step and engine.
+    A size of 0 stands for the demo map in grid.GRID, <maps> are chunked map files.
+    Engines are "batch" with constants.BACKEND, "column" or a backend name."""
+    grids = []
+    for size in sizes:
+        if size == 0:
+            grids.append(DenseGrid(grid.GRID, read_only=True))
+        else:
+            grids.append(synthetic_grid(size, seed=seed))
+    grids.extend(ChunkedGrid(path) for path in maps)
+    results = []
+    for grid_store in grids:
+        for width in widths:
+            for step in steps:
+                for engine in engines:
+                    results.append(
+                        run_benchmark(
+                            grid_store,
+                            width,
+                            step,
+                            frames,
+                            batch=engine != "column",
+                            seed=seed,
+                            backend=engine if engine in backends.BACKENDS else None,
+                        )
+                    )
+    return results
+
+
+def print_results(results) -> None:
+    header = (
+        f"{'map':>11} {'width':>6} {'step':>4} {'engine':>7} "
+        f"{'rays/s':>11} {'steps/s':>12} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}"
+    )
+    print(header)
+    for r in results:
+        print(
+            f"{r['map']:>11} {r['width']:>6} {r['step']:>4} {r['engine']:>7} "
+            f"{r['rays_per_sec']:>11.0f} {r['steps_per_sec']:>12.0f} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[0, 256, 1024],
+        help="synthetic map sizes, 0 is the demo map",
+    )
+    parser.add_argument("--maps", nargs="+", default=[], help="chunked map files")
+    parser.add_argument("--widths", type=int, nargs="+", default=[600, 1200])
+    parser.add_argument("--steps", type=int, nargs="+", default=[constants.STEP, 4])
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=["batch", "column", *backends.BACKENDS],
+        default=["batch", "column"],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = run_suite(
+        args.sizes, args.widths, args.steps, args.frames, args.engines, args.seed,
+        args.maps,
+    )
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,176 @@
+"""Chunked binary map format for worlds too large for a GRID literal.
+A map file is a small header followed by the grid split into square chunks
+of chunk x chunk elements, each stored contiguously. The file is memory
+mapped, so only the chunks that rays actually touch are paged in, and a
+chunk is validated against constants.INT_TO_COLOR the first time it is read.
+
+File layout (little endian):
+    magic   5 bytes     b"RCMAP"
+    version uint8
+    width   uint32      number of x positions
+    height  uint32      number of y positions
+    chunk   uint32      side length of a chunk
+    chunks  uint8[chunks_x, chunks_y, chunk, chunk]
+
+Usage:
+    python chunked_map.py demo.rcmap                    # convert grid.GRID
+    python chunked_map.py big.rcmap --random 4096       # synthetic test world
+"""
+from __future__ import annotations
+
+import argparse
+import struct
+
+import numpy as np
+
+import constants
+
+MAGIC = b"RCMAP"
+VERSION = 1
+HEADER = struct.Struct("<5sBIII")
+
+
+def validate(array) -> None:
+    """Vectorized check that every element is 0 or defined in constants.INT_TO_COLOR."""
+    array = np.asarray(array)
+    valid = np.array([0, *constants.INT_TO_COLOR], dtype=np.int64)
+    invalid = ~np.isin(array, valid)
+    assert not invalid.any(), (
+        f"Elements, {np.unique(array[invalid]).tolist()}, "
+        "not defined in constants.INT_TO_COLOR"
+    )
+
+
+def write_map(path, nested, chunk=constants.CHUNK) -> None:
+    """Write a grid, nested sequences or a 2D array indexed as [x, y], to <path>."""
+    array = np.asarray(nested)
+    assert array.ndim == 2, "Grid must be a 2D array!"
+    validate(array)
+    (width, height) = array.shape
+    chunks_x, chunks_y = -(-width // chunk), -(-height // chunk)
+    # pad to whole chunks, the padding is never read since it is out of bounds
+    padded = np.zeros((chunks_x * chunk, chunks_y * chunk), dtype=np.uint8)
+    padded[:width, :height] = array
+    chunks = padded.reshape(chunks_x, chunk, chunks_y, chunk).transpose(0, 2, 1, 3)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, width, height, chunk))
+        file.write(np.ascontiguousarray(chunks).tobytes())
+
+
+def convert_grid(path, chunk=constants.CHUNK) -> None:
+    """Write the GRID literal of grid.py to <path>."""
+    import grid
+
+    write_map(path, grid.GRID, chunk)
+
+
+class ChunkedGrid:
+    """Read only grid backed by a memory mapped map file.
+    Supports the same reads as DenseGrid, positions outside of the map read as OUTSIDE.
+    <touched> marks every chunk that has been read and validated so far."""
+
+    OUTSIDE = -1
+
+    def __init__(self, path) -> None:
+        with open(path, "rb") as file:
+            (magic, version, width, height, chunk) = HEADER.unpack(
+                file.read(HEADER.size)
+            )
+        assert magic == MAGIC, f"{path} is not a map file!"
+        assert version == VERSION, f"Unsupported map file version, {version}"
+        self.width, self.height, self.chunk = width, height, chunk
+        chunks_x, chunks_y = -(-width // chunk), -(-height // chunk)
+        self._chunks = np.memmap(
+            path,
+            dtype=np.uint8,
+            mode="r",
+            offset=HEADER.size,
+            shape=(chunks_x, chunks_y, chunk, chunk),
+        )
+        self.touched = np.zeros((chunks_x, chunks_y), dtype=bool)
+        # the file never changes while it is mapped
+        self.version = 0
+        self.read_only = True
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.width, self.height)
+
+    @property
+    def resident_chunks(self) -> int:
+        """How many chunks have been read so far."""
+        return int(self.touched.sum())
+
+    def _touch(self, chunk_xs, chunk_ys) -> None:
+        """Validate the chunks that are read for the first time."""
+        new = ~self.touched[chunk_xs, chunk_ys]
+        if not new.any():
+            return
+        for cx, cy in set(zip(chunk_xs[new].tolist(), chunk_ys[new].tolist())):
+            validate(self._chunks[cx, cy])
+            self.touched[cx, cy] = True
+
+    def in_bounds(self, x, y) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get(self, xy, default=OUTSIDE) -> int:
+        x, y = xy[:]
+        if not self.in_bounds(x, y):
+            return default
+        (cx, lx), (cy, ly) = divmod(int(x), self.chunk), divmod(int(y), self.chunk)
+        if not self.touched[cx, cy]:
+            self._touch(np.array([cx]), np.array([cy]))
+        return int(self._chunks[cx, cy, lx, ly])
+
+    def __getitem__(self, xy) -> int:
+        return self.get(xy)
+
+    def __setitem__(self, xy, element) -> None:
+        raise TypeError("Grid is read only!")
+
+    def changes_since(self, version):
+        """Map files never change, see DenseGrid.changes_since."""
+        return []
+
+    def lookup(self, xs, ys) -> np.ndarray:
+        """Vectorized get, see DenseGrid.lookup."""
+        xs, ys = np.broadcast_arrays(np.asarray(xs), np.asarray(ys))
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        elements = np.full(xs.shape, self.OUTSIDE, dtype=np.int16)
+        (cx, lx) = np.divmod(xs[inside], self.chunk)
+        (cy, ly) = np.divmod(ys[inside], self.chunk)
+        self._touch(cx, cy)
+        elements[inside] = self._chunks[cx, cy, lx, ly]
+        return elements
+
+    def region(self, x0, y0, x1, y1) -> np.ndarray:
+        """Elements in [x0, x1) x [y0, y1), clipped to the grid."""
+        x0, x1 = max(x0, 0), min(x1, self.width)
+        y0, y1 = max(y0, 0), min(y1, self.height)
+        xs, ys = np.arange(x0, max(x0, x1)), np.arange(y0, max(y0, y1))
+        return self.lookup(xs[:, None], ys[None, :]).astype(np.uint8)
+
+    def row(self, x) -> np.ndarray:
+        """All elements with the given x, ordered by y."""
+        return self.region(x, 0, x + 1, self.height)[0]
+
+    def column(self, y) -> np.ndarray:
+        """All elements with the given y, ordered by x."""
+        return self.region(0, y, self.width, y + 1)[:, 0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="map file to write")
+    parser.add_argument("--chunk", type=int, default=constants.CHUNK)
+    parser.add_argument(
+        "--random", type=int, metavar="SIZE",
+        help="write a random walled SIZE x SIZE world instead of grid.GRID",
+    )
+    args = parser.parse_args()
+    if args.random:
+        import benchmark
+
+        write_map(args.path, benchmark.synthetic_grid(args.random).array, args.chunk)
+    else:
+        convert_grid(args.path, args.chunk)
@@ -0,0 +1,164 @@
+"""Frame to frame cache of cast columns.
+The walls of a frame only depend on the camera pose and the grid, so while
+the camera stands still the columns of the previous frame are reused as is.
+If only a few tiles of the grid changed, only the columns whose ray passes
+through one of them before hitting its wall are cast again."""
+from __future__ import annotations
+
+import numpy as np
+
+import backends
+import constants
+import distance_field
+import numerical
+import raycaster
+import vectorized
+
+
+def crossed_tiles(origin, ray_x, ray_y, dist, tiles) -> np.ndarray:
+    """Slab test of every ray against every tile in <tiles>.
+    A ray from <origin> along (ray_x[i], ray_y[i]) is affected by a tile if it
+    enters the tile at a distance of at most dist[i], up to the tolerance of
+    the DDA.
+    @return bool array, True for every ray that is affected by any tile."""
+    tiles = np.asarray(tiles, dtype=float).reshape(-1, 2)
+    low_x, low_y = tiles[:, 0], tiles[:, 1]
+    # rays along the first axis, tiles along the second
+    (ray_x, ray_y, dist) = (ray_x[:, None], ray_y[:, None], dist[:, None])
+
+    def slab(origin, ray, low):
+        """Distances at which the rays enter and leave the slab [low, low + 1]."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - origin) / ray
+            t2 = (low + 1 - origin) / ray
+        # rays parallel to the slab are either always or never inside it
+        inside = (low <= origin) & (origin <= low + 1)
+        parallel = ray == 0
+        enter = np.where(
+            parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2)
+        )
+        leave = np.where(
+            parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2)
+        )
+        return enter, leave
+
+    (enter_x, leave_x) = slab(origin.x, ray_x, low_x)
+    (enter_y, leave_y) = slab(origin.y, ray_y, low_y)
+    enter = np.maximum(enter_x, enter_y)
+    leave = np.minimum(leave_x, leave_y)
+    # the DDA takes crossings within numerical.REL_TOL of each other as a tie,
+    # so a ray may enter a tile it passes that far from the corner of. Widen
+    # the test by that much at the distance of the tile so these are cast again
+    reach = np.minimum(dist, constants.VIEW_DISTANCE)
+    slack = 2 * numerical.REL_TOL * reach + 1e-6
+    crossed = (enter <= leave + slack) & (leave >= -slack) & (enter <= dist + slack)
+    return crossed.any(axis=1)
+
+
+class ColumnCache:
+    """Caches the Columns of the last cast_columns call.
+    <hits> counts casts answered from the cache, <partial> casts where only the
+    columns affected by grid writes were cast again and <misses> full casts.
+    <columns_cast> and <columns_reused> count the columns behind those numbers."""
+
+    RECAST = 256                    # cast everything if more tiles changed
+
+    def __init__(self) -> None:
+        self.key = None
+        self.grid = None
+        self.version = None
+        self.columns = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = self.partial = self.misses = 0
+        self.columns_cast = self.columns_reused = 0
+
+    def stats(self) -> dict:
+        """Counters of the cache, see ColumnCache."""
+        casts = self.hits + self.partial + self.misses
+        return {
+            "hits": self.hits,
+            "partial": self.partial,
+            "misses": self.misses,
+            "hit_rate": self.hits / casts if casts else 0.0,
+            "columns_cast": self.columns_cast,
+            "columns_reused": self.columns_reused,
+        }
+
+    def cast_columns(
+        self,
+        origin,
+        direction,
+        plane,
+        grid,
+        width,
+        step=1,
+        batch=False,
+        start=0,
+        stop=None,
+        field=None,
+        backend=None,
+    ) -> vectorized.Columns:
+        """Cached raycaster.cast_columns, takes the same arguments."""
+        stop = width if stop is None else stop
+        pose = (tuple(origin), tuple(direction), tuple(plane))
+        key = (*pose, width, step, batch, start, stop, backend)
+        if key == self.key and grid is self.grid:
+            changes = grid.changes_since(self.version)
+            if changes == []:
+                self.hits += 1
+                self.columns_reused += len(self.columns.dist)
+                return self.columns
+            if changes is not None and len(changes) <= self.RECAST:
+                return self._recast(origin, direction, plane, grid, changes, field)
+        self.misses += 1
+        self.columns = raycaster.cast_columns(
+            origin,
+            direction,
+            plane,
+            grid,
+            width,
+            step,
+            batch,
+            start,
+            stop,
+            field,
+            backend,
+        )
+        self.columns_cast += len(self.columns.dist)
+        (self.key, self.grid, self.version) = (key, grid, grid.version)
+        return self.columns
+
+    def _recast(self, origin, direction, plane, grid, changes, field):
+        """Cast the cached columns again whose rays cross a changed tile."""
+        (width, step, batch, start, stop, backend) = self.key[3:]
+        (_, ray_x, ray_y) = vectorized.get_rays(
+            direction, plane, width, step, start, stop
+        )
+        old = self.columns
+        affected = np.flatnonzero(
+            crossed_tiles(origin, ray_x, ray_y, old.dist, sorted(set(changes)))
+        )
+        columns = vectorized.Columns(*(values.copy() for values in old))
+        if batch:
+            fresh = backends.get(backend)(
+                origin.x,
+                origin.y,
+                ray_x[affected],
+                ray_y[affected],
+                grid,
+                constants.VIEW_DISTANCE,
+                field or distance_field.for_grid(grid),
+            )
+        else:
+            rays = (constants.Point2(ray_x[i], ray_y[i]) for i in affected)
+            results = [raycaster.run_along_ray(origin, ray, grid) for ray in rays]
+            fresh = zip(*results) if results else ((),) * len(columns)
+        for values, new in zip(columns, fresh):
+            values[affected] = new
+        self.partial += 1
+        self.columns_cast += len(affected)
+        self.columns_reused += len(old.dist) - len(affected)
+        (self.columns, self.version) = (columns, grid.version)
+        return columns
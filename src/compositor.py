@@ -0,0 +1,119 @@
+"""Dirty rectangle compositing of the game screen.
+Instead of redrawing and flipping the whole window every frame, only the
+regions that changed are pushed to the display: runs of wall columns whose
+span or color differs from the last frame, the minimap and the text box.
+The floor and ceiling are pre-rendered once into a background surface."""
+from __future__ import annotations
+
+import numpy as np
+import pygame as pg
+
+import constants
+
+
+def column_runs(changed) -> list:
+    """(start, stop) of every run of True values in the 1D bool array <changed>."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], changed.view(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+class Compositor:
+    """Collects the dirty rectangles of one frame of <screen> and presents them.
+    <background> holds the pre-rendered ceiling and floor."""
+
+    def __init__(self, screen) -> None:
+        self.screen = screen
+        self.rect = screen.get_rect()
+        self.spans = None
+        self.colors = None
+        self.overlays = {}
+        self.rects = []
+        # framebuffer shown on screen by update_walls, used by restore
+        self.source = None
+        self.packed = True
+        self.render_background()
+
+    def render_background(self) -> None:
+        """Pre-render the ceiling and floor halves of the screen."""
+        (width, height) = self.rect.size
+        self.background = pg.Surface((width, height), 0, self.screen)
+        self.background.fill(constants.CEILING, pg.Rect(0, 0, width, height // 2))
+        self.background.fill(
+            constants.FLOOR, pg.Rect(0, height // 2, width, height - height // 2)
+        )
+        self.colors = (constants.CEILING, constants.FLOOR)
+        self.mark_all()
+
+    def mark(self, rect) -> None:
+        self.rects.append(pg.Rect(rect))
+
+    def mark_all(self, source=None, packed=True) -> None:
+        """The whole screen was redrawn without update_walls. <source> is the
+        screen sized framebuffer that was blit, if any, see restore."""
+        self.rects = [self.rect.copy()]
+        # the next frame cannot be compared to this one
+        self.spans = None
+        (self.source, self.packed) = (source, packed)
+
+    def draw_background(self) -> None:
+        """Blit the pre-rendered ceiling and floor over the whole screen."""
+        if (constants.CEILING, constants.FLOOR) != self.colors:
+            self.render_background()
+        self.screen.blit(self.background, (0, 0))
+        self.mark_all()
+
+    def update_walls(self, framebuffer, packed=True) -> list:
+        """Copy the screen columns of <framebuffer> whose wall changed since the
+        last call to the screen, see FrameBuffer.spans. <packed> is True if
+        the screen takes the packed pixels. Every column is copied after mark_all.
+        @return the rectangles that were copied."""
+        if (constants.CEILING, constants.FLOOR) != self.colors:
+            self.render_background()
+        if self.spans is None or self.spans.shape != framebuffer.spans.shape:
+            runs = [(0, framebuffer.width)]
+        else:
+            changed = (self.spans != framebuffer.spans).any(axis=1)
+            runs = column_runs(changed)
+        self.spans = framebuffer.spans.copy()
+        (self.source, self.packed) = (framebuffer, packed)
+        height = self.rect.height
+        rects = [pg.Rect(start, 0, stop - start, height) for start, stop in runs]
+        for rect in rects:
+            self.copy(rect)
+        self.rects.extend(rects)
+        return rects
+
+    def copy(self, rect) -> None:
+        """Copy the pixels inside <rect> from the framebuffer of update_walls."""
+        pixels = self.source.pixels if self.packed else self.source.rgb
+        part = pixels[rect.left:rect.right, rect.top:rect.bottom]
+        pg.surfarray.blit_array(self.screen.subsurface(rect), part)
+
+    def restore(self, rect) -> None:
+        """Draw the walls under <rect> again, e.g. before an overlay that shrank.
+        Nothing is restored without a source framebuffer."""
+        if self.source is not None and rect.width and rect.height:
+            self.copy(rect)
+
+    def overlay(self, name, rect, changed=True):
+        """Track the overlay <name> that is drawn over the walls at <rect>.
+        An overlay has to be drawn again if it <changed>, moved, or a dirty
+        rectangle of this frame covers it.
+        @return the dirty rectangle covering its old and new position, the
+        walls in it have to be restored before drawing the overlay,
+        None if the overlay is still on screen."""
+        rect = pg.Rect(rect)
+        old = self.overlays.get(name)
+        covered = rect.collidelist(self.rects) != -1
+        if not (changed or covered or old != rect):
+            return None
+        self.overlays[name] = rect
+        dirty = (rect if old is None else rect.union(old)).clip(self.rect)
+        self.mark(dirty)
+        return dirty
+
+    def present(self) -> None:
+        """Push the dirty rectangles of this frame to the display."""
+        if self.rects:
+            pg.display.update(self.rects)
+        self.rects = []
@@ -7,10 +7,26 @@ Point2 = namedtuple("Point2", "x y")
 # GAME SETTINGS
 SIZE = (600, 600)               # game window size
 FPS = 60                        # max fps of game
+TICK_RATE = 120                 # fixed simulation steps per second, movement does not depend on the fps
+MAX_FRAME_TIME = 0.25           # seconds simulated at most per frame, slower frames slow the game down
 
 # WORLD SETTINGS
 STEP = 1                        # how many steps to take when casting rays
 SLOW = False                    # show raycasting drawing process
+VIEW_DISTANCE = 100             # rays further than this many tiles hit nothing
+SKIP_RADIUS = 16                # empty space skipping radius, below 3 disables it
+BATCH = True                    # cast all columns at once with the vectorized DDA
+BACKEND = "auto"                # DDA of the batch path: "numpy", "numba", or "auto" for numba if installed
+FRAMEBUFFER = True              # write walls into one pixel array, blit once per frame
+WORKERS = 0                     # processes for strip rendering, 0 uses every core
+STRIP = 64                      # screen columns per strip handed to a worker
+PARALLEL_WIDTH = 1200           # render in parallel from this window width on
+PIPELINE = True                 # cast the next frame on a thread while the last one is shown, framebuffer only
+ADAPTIVE = True                 # lower the ray step and wall resolution to hold FPS while moving
+COMPOSITE = True                # only push the changed parts of the screen to the display
+CACHE = True                    # reuse the columns of the last frame while the camera is still
+MAP_FILE = None                 # chunked map file (see chunked_map.py) to play instead of grid.GRID
+CHUNK = 64                      # side length of the chunks in new map files
 # maps grid elements to colors
 INT_TO_COLOR = {
     1: (255, 0, 0),
@@ -24,6 +40,26 @@ INT_TO_COLOR = {
 }
 FLOOR = (50, 50, 50)            # color of floor
 CEILING = (25, 25, 25)          # color of ceiling
+SHADE_LEVELS = 256              # distance buckets of the shading table, fewer means more banding
+TEXTURED = False                # draw textured walls instead of flat colors, framebuffer only
+TEXTURES = {}                   # grid element -> image file, others get a procedural texture
+TEXTURE_SIZE = 64               # textures are resampled to this power of 2 size
+TEXTURE_SLOTS = 256             # shaded texture copies kept, 16 KiB each at size 64
+TEXTURE_LEVELS = 32             # distance buckets of the texture shading
+FLATS = False                   # cast the floor and ceiling row by row, shaded by distance, framebuffer only
+TEXTURED_FLATS = False          # texture the cast floor and ceiling
+FLOOR_TEXTURE = None            # image file of the floor, tiles in the FLOOR color if None
+CEILING_TEXTURE = None          # image file of the ceiling, tiles in the CEILING color if None
+ENTITIES = 0                    # wandering entities scattered over the map, framebuffer only
+ENTITY_CELL = 4                 # side length in tiles of the cells of the entity spatial hash
+SPRITE_SIZE = 32                # texels per side of the entity sprite
+
+
+# PROFILER SETTINGS
+PROFILE = False                 # time the stages of every frame, see profiler.py
+PROFILE_WINDOW = 300            # frames kept for the percentiles
+PROFILE_OVERLAY = True          # show the percentiles on screen while profiling
+PROFILE_DUMP = None             # .csv or .json file the last frames are written to on exit
 
 
 # PLAYER SETTINGS
@@ -34,3 +70,6 @@ if SLOW:
 
 # MINIMAP SETTINGS
 SCALE = 6                       # scaling of minimap
+MINIMAP_VIEW = None             # tiles shown around the player, None shows the whole map
+MINIMAP_FULL = 64               # maps larger than this many tiles on a side are never shown whole
+MINIMAP_WINDOW = 32             # tiles shown around the player on those maps, e.g. map files
@@ -0,0 +1,104 @@
+"""Array backed grid store.
+Elements are kept in one contiguous typed array instead of a dict of tuples,
+so lookups outside of the map never allocate or insert anything."""
+from __future__ import annotations
+
+from collections import deque
+
+import numpy as np
+
+
+class DenseGrid:
+    """Grid of integer elements indexed by a cartesian pair (x, y).
+    Indexing is bounds checked, positions outside of the grid read as OUTSIDE.
+    A read only grid refuses writes, every accepted write bumps <version>
+    and is remembered so caches can catch up with changes_since."""
+
+    OUTSIDE = -1
+    CHANGE_LOG = 1024               # how many writes are remembered
+
+    def __init__(self, nested, read_only=False, dtype=np.uint8, copy=True) -> None:
+        if copy:
+            self._array = np.array(nested, dtype=dtype, order="C")
+        else:
+            # share the memory of an existing array, e.g. shared memory
+            self._array = np.asarray(nested, dtype=dtype)
+        assert self._array.ndim == 2, "Grid must be a 2D array!"
+        self.version = 0
+        self.read_only = read_only
+        # (version, x, y) of the latest writes
+        self._changes = deque(maxlen=self.CHANGE_LOG)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._array.shape
+
+    @property
+    def array(self) -> np.ndarray:
+        """Read only view of the underlying array, indexed as [x, y]."""
+        view = self._array.view()
+        view.flags.writeable = False
+        return view
+
+    def in_bounds(self, x, y) -> bool:
+        rows, cols = self._array.shape
+        return 0 <= x < rows and 0 <= y < cols
+
+    def get(self, xy, default=OUTSIDE) -> int:
+        x, y = xy[:]
+        if self.in_bounds(x, y):
+            return int(self._array[x, y])
+        return default
+
+    def __getitem__(self, xy) -> int:
+        return self.get(xy)
+
+    def __setitem__(self, xy, element) -> None:
+        x, y = xy[:]
+        if self.read_only:
+            raise TypeError("Grid is read only!")
+        if not self.in_bounds(x, y):
+            raise IndexError(f"Position, {(x, y)}, is outside of the grid!")
+        self._array[x, y] = element
+        self.version += 1
+        self._changes.append((self.version, x, y))
+
+    def changes_since(self, version):
+        """Positions written after <version>, oldest first.
+        @return None if the writes are no longer remembered."""
+        if version == self.version:
+            return []
+        if not self._changes or self._changes[0][0] > version + 1:
+            return None
+        return [(x, y) for v, x, y in self._changes if v > version]
+
+    def lookup(self, xs, ys) -> np.ndarray:
+        """Vectorized get. Returns the element at every (xs[i], ys[i]),
+        OUTSIDE where the position is not on the grid."""
+        xs, ys = np.broadcast_arrays(np.asarray(xs), np.asarray(ys))
+        rows, cols = self._array.shape
+        inside = (xs >= 0) & (xs < rows) & (ys >= 0) & (ys < cols)
+        elements = np.full(xs.shape, self.OUTSIDE, dtype=np.int16)
+        elements[inside] = self._array[xs[inside], ys[inside]]
+        return elements
+
+    def row(self, x) -> np.ndarray:
+        """All elements with the given x, ordered by y."""
+        return self.array[x]
+
+    def column(self, y) -> np.ndarray:
+        """All elements with the given y, ordered by x."""
+        return self.array[:, y]
+
+    def region(self, x0, y0, x1, y1) -> np.ndarray:
+        """Elements in [x0, x1) x [y0, y1), clipped to the grid."""
+        rows, cols = self._array.shape
+        x0, x1 = max(x0, 0), min(x1, rows)
+        y0, y1 = max(y0, 0), min(y1, cols)
+        return self.array[x0:max(x0, x1), y0:max(y0, y1)]
+
+    def walls(self):
+        """Positions and elements of every non empty tile.
+        @return (xs, ys, elements): arrays of equal length."""
+        xs, ys = np.nonzero(self._array)
+        return xs, ys, self._array[xs, ys]
@@ -0,0 +1,106 @@
+"""Distance field for empty space skipping.
+Every tile stores the Chebyshev distance to the nearest wall, capped at a
+radius. A tile with value r is the center of an empty square of
+(2r - 1) x (2r - 1) tiles, so a ray standing on it can skip to the edge of
+that square in one jump instead of walking it tile by tile."""
+from __future__ import annotations
+
+import weakref
+
+import numpy as np
+
+import constants
+
+# distance fields of the grids used so far, see for_grid
+_fields = weakref.WeakKeyDictionary()
+
+
+def chebyshev_field(walls, radius) -> np.ndarray:
+    """Chebyshev distance of every tile to the nearest True tile in <walls>,
+    capped at <radius>. Positions outside of <walls> count as empty."""
+    field = np.full(walls.shape, radius, dtype=np.uint8)
+    field[walls] = 0
+    reached = walls.copy()
+    for distance in range(1, radius):
+        # grow the reached tiles by one tile in all 8 directions
+        grown = reached.copy()
+        grown[1:] |= reached[:-1]
+        grown[:-1] |= reached[1:]
+        spread = grown.copy()
+        spread[:, 1:] |= grown[:, :-1]
+        spread[:, :-1] |= grown[:, 1:]
+        field[spread & ~reached] = distance
+        reached = spread
+    return field
+
+
+class DistanceField:
+    """Capped distance field of a DenseGrid that follows the writes to the grid.
+    Call sync() before reading it to pick up grid changes.
+    <values> wraps an existing field of <grid> instead of building one,
+    e.g. a field kept in shared memory by another process."""
+
+    OUTSIDE = 0
+    REBUILD = 64                    # rebuild everything if more tiles changed
+
+    def __init__(self, grid, radius=constants.SKIP_RADIUS, values=None) -> None:
+        assert 1 <= radius <= 255, "Radius must fit in a uint8!"
+        self.grid = grid
+        self.radius = radius
+        if values is None:
+            self.rebuild()
+        else:
+            assert values.shape == grid.shape, "Field must match the grid!"
+            self.values = values
+            self.version = grid.version
+
+    def rebuild(self) -> None:
+        self.values = chebyshev_field(self.grid.array > 0, self.radius)
+        self.version = self.grid.version
+
+    def update(self, positions) -> None:
+        """Recompute the tiles whose distance may change when <positions> change."""
+        (rows, cols) = self.values.shape
+        # tiles within radius - 1 depend on a changed tile, and those
+        # depend on walls up to radius - 1 further out
+        reach = self.radius - 1
+        for x, y in positions:
+            (x0, x1) = (max(x - 2 * reach, 0), min(x + 2 * reach + 1, rows))
+            (y0, y1) = (max(y - 2 * reach, 0), min(y + 2 * reach + 1, cols))
+            local = chebyshev_field(self.grid.array[x0:x1, y0:y1] > 0, self.radius)
+            (ix0, ix1) = (max(x - reach, 0), min(x + reach + 1, rows))
+            (iy0, iy1) = (max(y - reach, 0), min(y + reach + 1, cols))
+            self.values[ix0:ix1, iy0:iy1] = local[
+                ix0 - x0:ix1 - x0, iy0 - y0:iy1 - y0
+            ]
+
+    def sync(self) -> None:
+        """Catch up with writes made to the grid since the last sync."""
+        if self.grid.version == self.version:
+            return
+        changes = self.grid.changes_since(self.version)
+        if changes is None or len(changes) > self.REBUILD:
+            self.rebuild()
+        else:
+            self.update(set(changes))
+        self.version = self.grid.version
+
+    def lookup(self, xs, ys) -> np.ndarray:
+        """Distance at every (xs[i], ys[i]), OUTSIDE off the grid."""
+        (rows, cols) = self.values.shape
+        inside = (xs >= 0) & (xs < rows) & (ys >= 0) & (ys < cols)
+        values = np.full(xs.shape, self.OUTSIDE, dtype=np.int64)
+        values[inside] = self.values[xs[inside], ys[inside]]
+        return values
+
+
+def for_grid(grid, radius=constants.SKIP_RADIUS):
+    """Shared, synced DistanceField of <grid>.
+    @return None if skipping is disabled (radius < 3) or <grid> is not dense."""
+    if radius < 3 or not hasattr(grid, "array"):
+        return None
+    field = _fields.get(grid)
+    if field is None or field.radius != radius:
+        field = _fields[grid] = DistanceField(grid, radius)
+    field.sync()
+    return field
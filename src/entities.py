@@ -0,0 +1,280 @@
+"""Entities in the 3D view, e.g. pickups and NPCs.
+Entities are drawn as sprites like lodev's sprite casting: after the walls,
+every entity in view is projected to the screen, sorted far to near and
+drawn as vertical stripes, each stripe only where the entity is in front of
+the wall in FrameBuffer.depth.
+
+Every entity sits in a uniform grid spatial hash of <cell> x <cell> map
+tiles. A frame only visits the cells that overlap the view frustum up to the
+farthest wall on screen, so drawing costs grow with the entities in view,
+not with all entities on the map.
+"""
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+import constants
+import raycaster
+from framebuffer import pack_rgb
+
+
+def sprite(size=constants.SPRITE_SIZE) -> np.ndarray:
+    """Round sprite indexed [x, y]: 0 is transparent, 1 the darker rim
+    and 2 the body, shaded like the two sides of a wall.
+    @return (size, size) uint8 array."""
+    center = (np.arange(size) + 0.5) / size - 0.5
+    radius = np.hypot(center[:, None], center[None, :])
+    image = np.zeros((size, size), dtype=np.uint8)
+    image[radius <= 0.5] = 1
+    image[radius <= 0.4] = 2
+    return image
+
+
+class EntityLayer:
+    """Entities at float map positions, each with the color of a grid
+    element and a size in tiles. Every entity has an index that stays the
+    same until it is removed, <version> changes whenever an entity changes.
+    <drawn> counts the entities drawn in the last frame."""
+
+    NEAR = 0.05                     # entities closer to the camera are not drawn
+
+    def __init__(
+        self, cell=constants.ENTITY_CELL, size=constants.SPRITE_SIZE, capacity=64
+    ) -> None:
+        assert cell > 0, "Cells must be larger than 0!"
+        self.cell = cell
+        self.sprite = sprite(size)
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.elements = np.zeros(capacity, dtype=np.int16)
+        self.scales = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))
+        # (cell x, cell y) -> indices of the entities in that cell
+        self.cells = {}
+        self.version = 0
+        self.drawn = 0
+
+    @classmethod
+    def scatter(cls, grid, count, speed=1.0, seed=0, **kwargs) -> EntityLayer:
+        """Layer with <count> entities on random empty tiles of <grid>, in
+        random colors of constants.INT_TO_COLOR and moving at <speed> tiles
+        per second in random directions, see wander."""
+        layer = cls(**kwargs)
+        rng = np.random.default_rng(seed)
+        (rows, cols) = grid.shape
+        elements = sorted(constants.INT_TO_COLOR)
+        placed = 0
+        for _ in range(100):
+            if placed == count:
+                break
+            xy = rng.uniform((0, 0), (rows, cols), (count - placed, 2))
+            empty = grid.lookup(xy[:, 0].astype(int), xy[:, 1].astype(int)) == 0
+            for x, y in xy[empty]:
+                angle = rng.uniform(0, 2 * math.pi)
+                layer.add(
+                    x,
+                    y,
+                    elements[rng.integers(len(elements))],
+                    scale=rng.uniform(0.3, 0.7),
+                    velocity=(speed * math.cos(angle), speed * math.sin(angle)),
+                )
+            placed += int(empty.sum())
+        return layer
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def cell_of(self, x, y) -> tuple:
+        return (math.floor(x / self.cell), math.floor(y / self.cell))
+
+    def grow(self) -> None:
+        """Double the room for entities."""
+        capacity = len(self.alive)
+        for name in ("positions", "velocities", "elements", "scales", "alive"):
+            values = getattr(self, name)
+            extra = np.zeros((capacity, *values.shape[1:]), dtype=values.dtype)
+            setattr(self, name, np.concatenate([values, extra]))
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def add(self, x, y, element, scale=0.5, velocity=(0, 0)) -> int:
+        """Add an entity in the color of grid <element> whose sprite is <scale>
+        tiles high and standing on the floor at (<x>, <y>).
+        @return int: the index of the entity."""
+        if not self.free:
+            self.grow()
+        index = self.free.pop()
+        self.positions[index] = (x, y)
+        self.velocities[index] = velocity
+        self.elements[index] = element
+        self.scales[index] = scale
+        self.alive[index] = True
+        self.cells.setdefault(self.cell_of(x, y), set()).add(index)
+        self.version += 1
+        return index
+
+    def remove(self, index) -> None:
+        assert self.alive[index], f"Entity {index} does not exist!"
+        self._unlink(index, self.cell_of(*self.positions[index]))
+        self.alive[index] = False
+        self.free.append(index)
+        self.version += 1
+
+    def move(self, index, x, y) -> None:
+        """Move the entity <index> to (<x>, <y>)."""
+        assert self.alive[index], f"Entity {index} does not exist!"
+        (old, new) = (self.cell_of(*self.positions[index]), self.cell_of(x, y))
+        self.positions[index] = (x, y)
+        if old != new:
+            self._unlink(index, old)
+            self.cells.setdefault(new, set()).add(index)
+        self.version += 1
+
+    def _unlink(self, index, cell) -> None:
+        members = self.cells[cell]
+        members.discard(index)
+        if not members:
+            del self.cells[cell]
+
+    def wander(self, grid, seconds) -> None:
+        """Move every entity along its velocity for <seconds>, entities
+        bounce off the walls of <grid>. Only entities that left their
+        cell are moved in the spatial hash."""
+        moving = np.flatnonzero(self.alive & self.velocities.any(axis=1))
+        if not len(moving) or seconds <= 0:
+            return
+        positions = self.positions[moving]
+        velocities = self.velocities[moving]
+        # one axis at a time, so entities slide along walls
+        for axis in (0, 1):
+            moved = positions.copy()
+            moved[:, axis] += velocities[:, axis] * seconds
+            cells = np.floor(moved).astype(int)
+            blocked = grid.lookup(cells[:, 0], cells[:, 1]) != 0
+            velocities[blocked, axis] *= -1
+            positions[~blocked] = moved[~blocked]
+        old = np.floor(self.positions[moving] / self.cell).astype(int)
+        new = np.floor(positions / self.cell).astype(int)
+        self.positions[moving] = positions
+        self.velocities[moving] = velocities
+        for row in np.flatnonzero((old != new).any(axis=1)).tolist():
+            index = int(moving[row])
+            self._unlink(index, tuple(old[row].tolist()))
+            self.cells.setdefault(tuple(new[row].tolist()), set()).add(index)
+        self.version += 1
+
+    def candidates(self, origin, direction, plane, far) -> np.ndarray:
+        """Indices of the entities in the cells that overlap the view
+        frustum from <origin> up to the perpendicular distance <far>.
+        The cells are taken from the bounding box of the frustum or from
+        the occupied cells, whichever are fewer."""
+        if not self.cells:
+            return np.zeros(0, dtype=int)
+        cell = self.cell
+        apex = np.array(origin, dtype=float)
+        (forward, side) = (np.array(direction, float), np.array(plane, float))
+        corners = apex + far * np.array([forward - side, forward + side])
+        low = np.floor(np.minimum(apex, corners.min(axis=0)) / cell).astype(int)
+        high = np.floor(np.maximum(apex, corners.max(axis=0)) / cell).astype(int)
+        (nx, ny) = high - low + 1
+        if nx * ny <= len(self.cells):
+            grid = np.mgrid[low[0]:high[0] + 1, low[1]:high[1] + 1]
+            keys = grid.reshape(2, -1).T
+        else:
+            keys = np.array(list(self.cells))
+        # cell centers against the two sides and the depth of the frustum,
+        # widened by the cell radius and the largest sprite
+        margin = cell * math.sqrt(0.5) + self.scales.max()
+        centers = (keys + 0.5) * cell - apex
+        orientation = math.copysign(1, forward[0] * side[1] - forward[1] * side[0])
+        inside = np.ones(len(keys), dtype=bool)
+        for edge, sign in ((forward - side, 1), (forward + side, -1)):
+            # cross product, which side of the edge every center is on
+            cross = edge[0] * centers[:, 1] - edge[1] * centers[:, 0]
+            inside &= sign * orientation * cross >= -margin * np.hypot(*edge)
+        depth = centers @ forward / np.hypot(*forward)
+        inside &= (depth >= -margin) & (depth <= far + margin)
+        found = [self.cells.get(key) for key in map(tuple, keys[inside].tolist())]
+        members = [index for occupants in found if occupants for index in occupants]
+        return np.array(members, dtype=int)
+
+    def draw(self, framebuffer, origin, direction, plane) -> int:
+        """Draw the entities seen from <origin> over the walls of <framebuffer>,
+        hidden where FrameBuffer.depth is closer. Shades come from
+        raycaster.SHADING, which render_columns refreshes.
+        @return int: how many entities were drawn."""
+        (width, height) = (framebuffer.width, framebuffer.height)
+        depth = framebuffer.depth
+        # nothing behind the farthest wall can be seen
+        far = min(float(depth.max()), constants.VIEW_DISTANCE)
+        index = self.candidates(origin, direction, plane, far)
+        self.drawn = 0
+        if not len(index):
+            return 0
+        # camera space like lodev: depth along direction, tx along the plane
+        (rel_x, rel_y) = (self.positions[index] - np.array(origin, dtype=float)).T
+        inverse = 1 / (plane.x * direction.y - direction.x * plane.y)
+        tx = inverse * (direction.y * rel_x - direction.x * rel_y)
+        ty = inverse * (-plane.y * rel_x + plane.x * rel_y)
+        scale = self.scales[index]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            screen_x = (width / 2) * (1 + tx / ty)
+            size = height / ty * scale
+        keep = (ty > self.NEAR) & (ty <= far + scale)
+        keep &= (screen_x + size / 2 > 0) & (screen_x - size / 2 < width)
+        # far to near, nearer entities are drawn over farther ones
+        order = np.flatnonzero(keep)[np.argsort(-ty[keep], kind="stable")]
+        (index, ty, size) = (index[order], ty[order], size[order])
+        left = screen_x[order] - size / 2
+        # standing on the floor, which is (height / 2) / ty below the horizon
+        bottom = (height + height / ty) / 2
+        top = bottom - size
+        # screen columns and rows whose pixel centers the sprite covers
+        x0 = np.maximum(np.ceil(left - 0.5), 0).astype(int)
+        x1 = np.minimum(np.ceil(left + size - 0.5), width).astype(int)
+        y0 = np.maximum(np.ceil(top - 0.5), 0).astype(int)
+        y1 = np.minimum(np.ceil(bottom - 0.5), height).astype(int)
+        # entities behind the walls of every column they cover are hidden
+        shown = (x0 < x1) & (y0 < y1)
+        if not shown.any():
+            return 0
+        bounds = np.stack([x0[shown], x1[shown]], axis=1).ravel()
+        farthest = np.maximum.reduceat(np.append(depth, 0), bounds)[::2]
+        shown[shown] = ty[shown] < farthest
+        (index, ty, size, left, top) = (
+            values[shown] for values in (index, ty, size, left, top)
+        )
+        (x0, x1, y0, y1) = (x0[shown], x1[shown], y0[shown], y1[shown])
+        texels = len(self.sprite)
+        ratio = texels / size
+        # transparent, rim and body color of every entity
+        buckets = raycaster.SHADING.bucket(ty)
+        elements = self.elements[index]
+        colors = np.zeros((len(index), 3), dtype="<u4")
+        colors[:, 1:] = pack_rgb(raycaster.SHADING.walls[elements, :, buckets])
+        rows = zip(
+            *(values.tolist() for values in (index, ty, x0, x1, y0, y1, left, top)),
+            ratio.tolist(),
+            colors,
+            buckets.tolist(),
+        )
+        for entity, distance, x0, x1, y0, y1, left, top, ratio, color, bucket in rows:
+            front = distance < depth[x0:x1]
+            tex_x = ((np.arange(x0, x1) + 0.5 - left) * ratio).astype(int)
+            tex_y = ((np.arange(y0, y1) + 0.5 - top) * ratio).astype(int)
+            np.minimum(tex_x, texels - 1, out=tex_x)
+            np.minimum(tex_y, texels - 1, out=tex_y)
+            image = self.sprite[tex_x][:, tex_y]
+            np.copyto(
+                framebuffer.pixels[x0:x1, y0:y1],
+                color[image],
+                where=(image != 0) & front[:, None],
+            )
+            # what the stripes show, so changed columns differ in spans
+            signature = hash((entity, int(color[2]), y0, y1, bucket))
+            overlay = framebuffer.spans[x0:x1, 4]
+            overlay[front] = overlay[front] * 31 + (tex_x[front] + signature)
+            self.drawn += 1
+        return self.drawn
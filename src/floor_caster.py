@@ -0,0 +1,180 @@
+"""Floor and ceiling casting.
+Instead of two flat halves, the floor and ceiling are cast one screen row at
+a time like lodev's floor casting: a row below the horizon shows the floor
+at a single distance, (height / 2) / (row - horizon), and the row mirrored
+above the horizon shows the ceiling at the same distance. Distances and
+shades are computed once per row and all pixels around the walls are then
+written at once with numpy.
+
+Shaded flats darken every row by the distance bucket of the wall shading
+table, in proportion to the color (ShadingTable.dim). Textured flats sample
+a floor and a ceiling texture that are pre-shaded for every distance bucket,
+so no pixel is shaded while drawing.
+"""
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+
+import constants
+import textures
+import vectorized
+from framebuffer import pack_rgb
+from shading import ShadingTable, current_palette
+
+
+class FloorCaster:
+    """Draws the floor and ceiling of a FrameBuffer around its walls.
+    With <textured> the flats show the textures constants.FLOOR_TEXTURE and
+    constants.CEILING_TEXTURE (tiles in the floor and ceiling colors without
+    one), resampled to <size> and shaded in <levels> distance buckets.
+    Otherwise every row only gets its distance shaded color."""
+
+    def __init__(
+        self,
+        textured=constants.TEXTURED_FLATS,
+        size=constants.TEXTURE_SIZE,
+        levels=None,
+    ) -> None:
+        assert size & (size - 1) == 0, "Texture size must be a power of 2!"
+        self.textured = textured
+        self.size = size
+        if levels is None:
+            # as many as the walls, textures are stored once per level
+            levels = constants.TEXTURE_LEVELS if textured else constants.SHADE_LEVELS
+        self.shading = ShadingTable(levels)
+        self.palette = None
+        # height -> packed column of the shaded flats
+        self.columns = {}
+        # (2, levels, size, size) packed floor and ceiling, one per bucket
+        self.texels = None
+        self._scratch = None
+
+    def refresh(self, palette=None) -> bool:
+        """Drop the shaded rows and textures if the colors or texture files
+        in constants changed, <palette> is a shading.current_palette()
+        snapshot like for ShadingTable.refresh.
+        @return bool: True if they were dropped."""
+        if palette is None:
+            palette = current_palette()
+        palette = (palette, constants.FLOOR_TEXTURE, constants.CEILING_TEXTURE)
+        if palette == self.palette:
+            return False
+        self.palette = palette
+        self.shading.refresh(palette[0])
+        self.columns.clear()
+        self.texels = None
+        return True
+
+    @staticmethod
+    def row_distances(height) -> np.ndarray:
+        """Distance of the floor seen in every row from the horizon
+        (height // 2) down, at the center of the row."""
+        rows = np.arange(height // 2, height)
+        return (height / 2) / np.maximum(rows + 0.5 - height / 2, 0.5)
+
+    def column(self, height) -> np.ndarray:
+        """Packed colors of the shaded ceiling and floor rows of a column."""
+        if height not in self.columns:
+            bucket = self.shading.bucket(self.row_distances(height))
+            (_, ceiling, floor) = self.palette[0]
+            column = np.empty(height, dtype="<u4")
+            column[height // 2:] = pack_rgb(self.shading.dim(floor, bucket))
+            # ceiling row y mirrors floor row height - 1 - y
+            ceiling = pack_rgb(self.shading.dim(ceiling, bucket))
+            column[: height // 2] = ceiling[::-1][: height // 2]
+            self.columns[height] = column
+        return self.columns[height]
+
+    def build(self) -> np.ndarray:
+        """Floor and ceiling textures shaded for every distance bucket."""
+        (_, ceiling, floor) = self.palette[0]
+        texels = np.empty((2, self.shading.levels, self.size, self.size), "<u4")
+        for index, (path, color) in enumerate(
+            [
+                (constants.FLOOR_TEXTURE, floor),
+                (constants.CEILING_TEXTURE, ceiling),
+            ]
+        ):
+            image = None
+            if path is not None:
+                try:
+                    image = textures.load_image(path, self.size)
+                except Exception as error:
+                    warnings.warn(f"Texture {path}: {error}")
+            if image is None:
+                image = textures.tiles(color, self.size, seed=index)
+            for bucket in range(self.shading.levels):
+                texels[index, bucket] = pack_rgb(self.shading.dim(image, bucket))
+        return texels
+
+    def draw(self, framebuffer, origin, direction, plane, step=1, start=0, stop=None):
+        """Overwrite the rows above and below the wall of every screen column
+        from <start> to <stop> (every column by default) of <framebuffer>,
+        see FrameBuffer.spans, with the floor and ceiling seen from <origin>.
+        Like the walls, one ray covers <step> screen columns."""
+        (width, height) = (framebuffer.width, framebuffer.height)
+        stop = width if stop is None else stop
+        if self.palette is None:
+            self.refresh()
+        if self._scratch is None or self._scratch[0].shape != (width, height):
+            # reused, fresh arrays of a whole frame cost page faults every frame
+            self._scratch = (
+                np.empty((width, height), dtype=bool),
+                np.empty((width, height), dtype=bool),
+                np.empty((width, height), dtype=np.float32),
+                np.empty((width, height), dtype=np.int32),
+                np.empty((width, height), dtype=np.int32),
+                np.empty((width, height), dtype="<u4"),
+            )
+        (outside, below, world, index, texel, image) = self._scratch
+        n = stop - start
+        spans = framebuffer.spans[start:stop]
+        rows = np.arange(height)
+        (outside, below) = (outside[:n], below[:n])
+        np.less(rows, spans[:, :1], out=outside)
+        np.greater(rows, spans[:, 1:2], out=below)
+        outside |= below
+        pixels = framebuffer.pixels[start:stop]
+        if not self.textured:
+            np.copyto(pixels, self.column(height), where=outside)
+            return
+        if self.texels is None:
+            self.texels = self.build()
+        (_, ray_x, ray_y) = vectorized.get_rays(
+            direction, plane, width, step, start, stop
+        )
+        rays = len(ray_x)
+        floor_rows = height - height // 2
+        (world, index, texel) = (
+            scratch[:rays, :floor_rows] for scratch in (world, index, texel)
+        )
+        dist = self.row_distances(height)
+        size = self.size
+        # texel coordinates are shifted by a multiple of size to be positive,
+        # so truncating them rounds down
+        reach = dist[0] * max(np.abs(ray_x).max(), np.abs(ray_y).max())
+        reach += max(abs(origin.x), abs(origin.y)) + 1
+        offset = size * 2 ** int(np.ceil(np.log2(reach)))
+        scaled = (dist * size).astype(np.float32)
+        # texel column from the world x and row from the world y of every pixel
+        np.multiply(scaled, ray_x.astype(np.float32)[:, None], out=world)
+        world += np.float32(origin.x * size + offset)
+        np.copyto(texel, world, casting="unsafe")
+        texel &= size - 1
+        texel *= size
+        np.multiply(scaled, ray_y.astype(np.float32)[:, None], out=world)
+        world += np.float32(origin.y * size + offset)
+        np.copyto(index, world, casting="unsafe")
+        index &= size - 1
+        texel += index
+        texel += self.shading.bucket(dist).astype(np.int32) * (size * size)
+        # the floor rows, then the ceiling rows mirrored
+        image = image[:rays]
+        (floor, ceiling) = self.texels.reshape(2, -1)
+        np.take(floor, texel, out=image[:, height // 2:])
+        np.take(ceiling, texel[:, ::-1][:, : height // 2], out=image[:, : height // 2])
+        if step > 1:
+            image = np.repeat(image, step, axis=0)[:n]
+        np.copyto(pixels, image, where=outside)
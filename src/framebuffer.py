@@ -0,0 +1,164 @@
+"""Persistent pixel array that walls are written into column by column.
+Pixels are packed as 0x00RRGGBB integers in a (width, height) array,
+the layout pygame.surfarray uses for 32 bit surfaces, so a whole frame
+is pushed to the screen with a single blit_array call."""
+import numpy as np
+
+import constants
+
+
+def pack_rgb(colors) -> np.ndarray:
+    """Pack an (..., 3) array of rgb colors into 0x00RRGGBB integers."""
+    colors = np.asarray(colors, dtype=np.uint32)
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+
+class FrameBuffer:
+    """Holds the pixels of one frame. The top half is filled with <ceiling>
+    and the bottom half with <floor>, wall spans are written on top.
+    <buffer> may be any writable buffer of width * (height + 1) * 4 bytes,
+    e.g. shared memory, to write the frame and then the depth buffer into
+    instead of new arrays. With clear=False the existing pixels of <buffer>
+    are left untouched.
+    spans[x] holds the first row, last row, packed color (or texel id), bits
+    of the float wall height of screen column x and a signature of what is
+    drawn over the wall (0 for nothing), so a column whose spans did not
+    change shows the same pixels. (0, -1, 0, 0, 0) is the background.
+    depth[x] is the perpendicular distance of the wall in column x, inf if
+    there is none, so entities drawn later can be hidden behind walls."""
+
+    EMPTY = (0, -1, 0, 0, 0)
+
+    def __init__(
+        self,
+        width,
+        height,
+        ceiling=constants.CEILING,
+        floor=constants.FLOOR,
+        buffer=None,
+        clear=True,
+    ):
+        self.width, self.height = width, height
+        # little endian so the byte order of rgb is the same on every machine
+        self.pixels = np.ndarray((width, height), dtype="<u4", buffer=buffer)
+        if buffer is None:
+            self.depth = np.empty(width, dtype="<f4")
+        else:
+            self.depth = np.ndarray(
+                width, dtype="<f4", buffer=buffer, offset=width * height * 4
+            )
+        self._rows = np.arange(height)
+        # per pixel scratch of draw_textures, allocated on first use
+        self._scratch = None
+        self.spans = np.empty((width, len(self.EMPTY)), dtype=np.int64)
+        self.spans[:] = self.EMPTY
+        self.set_background(ceiling, floor, clear)
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """(width, height, 3) uint8 view of the pixels, no copy is made."""
+        # bytes of 0x00RRGGBB are stored as B, G, R, 0
+        return self.pixels.view(np.uint8).reshape(self.width, self.height, 4)[..., 2::-1]
+
+    def set_background(self, ceiling, floor, clear=True) -> None:
+        """Set the colors of the ceiling and floor halves and clear the frame."""
+        self.background = np.empty(self.height, dtype="<u4")
+        self.background[: self.height // 2] = pack_rgb(ceiling)
+        self.background[self.height // 2:] = pack_rgb(floor)
+        if clear:
+            self.clear()
+
+    def clear(self) -> None:
+        """Fill every column with the ceiling and floor."""
+        self.pixels[:] = self.background
+        self.spans[:] = self.EMPTY
+        self.depth[:] = np.inf
+
+    def draw_columns(self, y_start, y_end, colors, step=1, start=0) -> None:
+        """Write one wall span per ray in a single vectorized pass.
+        Ray i covers the <step> screen columns from <start> + i * <step>,
+        which become the background with rows [y_start[i], y_end[i]] set to colors[i].
+        Rays with y_start > y_end only show the background."""
+        y_start = np.asarray(y_start).astype(int)
+        y_end = np.asarray(y_end).astype(int)
+        rows = self._rows
+        mask = (rows >= y_start[:, None]) & (rows <= y_end[:, None])
+        packed = pack_rgb(colors)
+        columns = np.where(mask, packed[:, None], self.background)
+        zeros = np.zeros_like(y_start)
+        spans = np.stack([y_start, y_end, packed, zeros, zeros], axis=1)
+        self._write(columns, spans, step, start)
+
+    def draw_textures(
+        self, line_height, texels, offsets, ids, step=1, start=0
+    ) -> None:
+        """draw_columns with textured walls. Ray i shows a texture column
+        stretched over a wall <line_height>[i] rows high centered on the screen.
+        <texels> are packed (n, size, size + 2) texture columns, each with a
+        ceiling texel before and a floor texel after it, so one clipped gather
+        draws the whole column. The column of ray i starts at the flat index
+        <offsets>[i] and <ids>[i] identifies its texels for spans,
+        see textures.TextureCache.sample."""
+        # bounded for walls right at the camera, whose height is infinite
+        line_height = np.minimum(np.asarray(line_height, dtype=float), 1e12)
+        size = texels.shape[-1] - 2
+        hit = line_height > 0
+        # texel of every row counted from the ceiling texel, rays that hit
+        # nothing switch from ceiling to floor at the middle row
+        scale = np.where(hit, size / np.where(hit, line_height, 1), 2 * (size + 1))
+        top = np.where(
+            hit, (self.height - line_height) / 2 - 1 / scale, self.height // 2 - 0.5
+        )
+        # the rows that get a texel of the wall, for spans
+        first = np.ceil((self.height - line_height) / 2)
+        last = np.ceil((self.height + line_height) / 2) - 1
+        y_start = np.where(hit, np.maximum(first, 0), self.height).astype(int)
+        y_end = np.where(hit, np.minimum(last, self.height - 1), -1).astype(int)
+        if self._scratch is None:
+            # reused, fresh arrays of a whole frame cost page faults every frame
+            self._scratch = (
+                np.empty((self.width, self.height), dtype=np.float32),
+                np.empty((self.width, self.height), dtype=np.int32),
+            )
+        n = len(line_height)
+        (tex_y, index) = (scratch[:n] for scratch in self._scratch)
+        np.subtract(
+            self._rows.astype(np.float32), top.astype(np.float32)[:, None], out=tex_y
+        )
+        tex_y *= scale.astype(np.float32)[:, None]
+        np.clip(tex_y, 0, size + 1, out=tex_y)
+        np.copyto(index, tex_y, casting="unsafe")
+        index += offsets.astype(np.int32)[:, None]
+        spans = np.stack(
+            [y_start, y_end, ids, line_height.view(np.int64), np.zeros_like(ids)],
+            axis=1,
+        )
+        if step == 1:
+            # gather straight into the frame
+            end = min(start + n, self.width)
+            np.take(texels.ravel(), index[: end - start], out=self.pixels[start:end])
+            self._write(None, spans, step, start)
+        else:
+            self._write(np.take(texels.ravel(), index), spans, step, start)
+
+    def set_depth(self, distance, step=1, start=0) -> None:
+        """Record the wall <distance> of every ray, ray i covers the <step>
+        screen columns from <start> + i * <step> like in draw_columns."""
+        distance = np.asarray(distance, dtype="<f4")
+        if step > 1:
+            distance = np.repeat(distance, step)
+        end = min(start + len(distance), self.width)
+        self.depth[start:end] = distance[: end - start]
+
+    def _write(self, columns, spans, step, start) -> None:
+        """Copy the (n, height) <columns> and their <spans> to the frame,
+        <columns> is None if they are already in place."""
+        spans[spans[:, 0] > spans[:, 1]] = self.EMPTY
+        if step > 1:
+            spans = np.repeat(spans, step, axis=0)
+        end = min(start + len(spans), self.width)
+        self.spans[start:end] = spans[: end - start]
+        if columns is not None:
+            if step > 1:
+                columns = np.repeat(columns, step, axis=0)
+            self.pixels[start:end] = columns[: end - start]
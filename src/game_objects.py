@@ -1,16 +1,20 @@
 """Holds simple game classes."""
+import numpy as np
 import pygame as pg
 
 import functions
 import constants
 import grid
+from chunked_map import ChunkedGrid
+from dense_grid import DenseGrid
 
 
-# construct dictionary from a nested array to simplify grid indexing
-Grid = {}
-for x, row in enumerate(grid.GRID):
-    for y, element in enumerate(row):
-        Grid[(x, y)] = element
+if constants.MAP_FILE is None:
+    # construct a dense grid from the nested array to simplify grid indexing
+    Grid = DenseGrid(grid.GRID)
+else:
+    # large worlds are paged in lazily from a memory mapped file
+    Grid = ChunkedGrid(constants.MAP_FILE)
 
 
 class Player:
@@ -40,44 +44,132 @@ class Player:
         )
         self.plane = constants.Point2(*functions.rotate_by_step(self.plane, rads))
 
-    def handle_event(self, events, pressed) -> None:
+    def handle_event(self, events, pressed, dt=1 / constants.FPS) -> None:
+        """Turn and move for <dt> seconds of the <pressed> keys, by
+        STEPSIZE and DEG_STEP every 1 / FPS seconds whatever the frame rate."""
+        scale = dt * constants.FPS
         # check pressed keys
         if pressed[pg.K_LEFT]:
-            self.rotate(-constants.DEG_STEP)
+            self.rotate(-constants.DEG_STEP * scale)
         if pressed[pg.K_RIGHT]:
-            self.rotate(constants.DEG_STEP)
+            self.rotate(constants.DEG_STEP * scale)
         if pressed[pg.K_DOWN]:
-            self.move(-1, -1)
+            self.move(-scale, -scale)
         if pressed[pg.K_UP]:
-            self.move(1, 1)
+            self.move(scale, scale)
 
 
 class MiniMap:
-    """Game object that represents a small 2D top down view of the map."""
+    """Game object that represents a small 2D top down view of the map.
+    The walls are rendered once into a cached layer and only tiles that
+    changed in the grid are redrawn. If <view> is given only a window of
+    view x view tiles around the player is shown and cached. Chunked maps and
+    maps larger than MINIMAP_FULL tiles of <shape>, Grid.shape by default,
+    always show a window of MINIMAP_WINDOW tiles, so only that part is read."""
 
-    def __init__(self):
+    BACKGROUND = (25, 25, 25)
+
+    def __init__(self, view=constants.MINIMAP_VIEW, shape=None):
         self.scale = constants.SCALE
-        self.w, self.h = len(grid.GRID), len(grid.GRID[0])
+        shape = Grid.shape if shape is None else shape
+        if view is None and (
+            isinstance(Grid, ChunkedGrid) or max(shape) > constants.MINIMAP_FULL
+        ):
+            view = constants.MINIMAP_WINDOW
+        self.view = view
+        if view is None:
+            self.w, self.h = shape
+        else:
+            self.w, self.h = view, view
         self.subwindow = pg.Surface((self.w * self.scale, self.h * self.scale))
+        # cached wall layer and the tile it starts at
+        self.layer = None
+        self.layer_origin = (0, 0)
+        self.layer_tiles = (0, 0)
+        self.version = None
+
+    def palette(self) -> np.ndarray:
+        """Map grid elements to colors, empty tiles get the background color."""
+        palette = np.empty((256, 3), dtype=np.uint8)
+        palette[:] = self.BACKGROUND
+        for element, color in constants.INT_TO_COLOR.items():
+            palette[element] = color
+        return palette
+
+    def render_layer(self, grid, x0, y0, tiles_w, tiles_h):
+        """Render the tiles [x0, x0 + tiles_w) x [y0, y0 + tiles_h) into the layer."""
+        self.layer = pg.Surface((tiles_w * self.scale, tiles_h * self.scale))
+        self.layer.fill(self.BACKGROUND)
+        region = grid.region(x0, y0, x0 + tiles_w, y0 + tiles_h)
+        if region.size:
+            pixels = self.palette()[region]
+            pixels = np.repeat(np.repeat(pixels, self.scale, axis=0), self.scale, axis=1)
+            tiles = pg.surfarray.make_surface(pixels)
+            offset = ((max(x0, 0) - x0) * self.scale, (max(y0, 0) - y0) * self.scale)
+            self.layer.blit(tiles, offset)
+        self.layer_origin = (x0, y0)
+        self.layer_tiles = (tiles_w, tiles_h)
+        self.version = grid.version
+
+    def update_layer(self, grid):
+        """Redraw only the tiles that changed since the layer was rendered."""
+        changes = grid.changes_since(self.version)
+        if changes is None:
+            # too many changes to catch up with
+            self.render_layer(grid, *self.layer_origin, *self.layer_tiles)
+            return
+        (x0, y0) = self.layer_origin
+        for x, y in changes:
+            element = grid[(x, y)]
+            color = constants.INT_TO_COLOR.get(element, self.BACKGROUND)
+            pg.draw.rect(
+                self.layer,
+                color,
+                pg.Rect(
+                    ((x - x0) * self.scale, (y - y0) * self.scale),
+                    (self.scale, self.scale),
+                ),
+            )
+        self.version = grid.version
 
     def draw(self, surface, grid, player):
-        self.subwindow.fill((25, 25, 25))
-        for index, element in grid.items():
-            x, y = index[:]
-            if element > 0:
-                color = constants.INT_TO_COLOR.get(element)
-                pg.draw.rect(
-                    self.subwindow,
-                    color,
-                    pg.Rect(
-                        (x * self.scale, y * self.scale),
-                        (self.scale, self.scale),
-                    ),
+        if self.view is None:
+            # the whole map is shown
+            (view_x, view_y) = (0, 0)
+            if self.layer is None:
+                self.render_layer(grid, 0, 0, *grid.shape)
+                self.subwindow = pg.Surface(self.layer.get_size())
+        else:
+            # window centered on the player
+            (view_x, view_y) = (player.x - self.view / 2, player.y - self.view / 2)
+            (x0, y0) = self.layer_origin
+            (tiles_w, tiles_h) = self.layer_tiles
+            if (
+                self.layer is None
+                or view_x < x0
+                or view_y < y0
+                or view_x + self.view > x0 + tiles_w
+                or view_y + self.view > y0 + tiles_h
+            ):
+                # cache the view plus a margin of half a view on every side
+                margin = self.view // 2 + 1
+                self.render_layer(
+                    grid,
+                    int(view_x) - margin,
+                    int(view_y) - margin,
+                    self.view + 2 * margin,
+                    self.view + 2 * margin,
                 )
-        scaled_pos = (player.x * self.scale, player.y * self.scale)
+        if grid.version != self.version:
+            self.update_layer(grid)
+        (x0, y0) = self.layer_origin
+        self.subwindow.blit(
+            self.layer, ((x0 - view_x) * self.scale, (y0 - view_y) * self.scale)
+        )
+        scaled_pos = ((player.x - view_x) * self.scale, (player.y - view_y) * self.scale)
         scaled_dir = (
-            (player.x + player.direction.x * 3) * self.scale,
-            (player.y + player.direction.y * 3) * self.scale,
+            (player.x - view_x + player.direction.x * 3) * self.scale,
+            (player.y - view_y + player.direction.y * 3) * self.scale,
         )
         pg.draw.circle(self.subwindow, (255, 0, 0), scaled_pos, 5)
         pg.draw.line(self.subwindow, (0, 255, 0), scaled_pos, scaled_dir, 5)
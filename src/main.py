@@ -6,7 +6,8 @@ With supplemental resource:
 Much of the code has been abstracted and compartmentalized to reduce boiler plate code.
 This abstraction is intended for beginner programmers to focus
 on the DDA algorithm in this program and skip pygame boilerplate code.
-The DDA algorithm is contained in the fuctions run_along_ray, and walk_along_ray.
+The DDA algorithm is contained in the fuctions run_along_ray, and walk_along_ray
+of the headless raycaster module.
 cast_rays handles drawing the world from the distances generated in the DDA algorithm.
 """
 import math
@@ -17,9 +18,17 @@ import numpy as np
 import pygame as pg
 
 import game_objects
-import numerical
 import constants
-import functions
+import raycaster
+from column_cache import ColumnCache
+from compositor import Compositor
+from entities import EntityLayer
+from floor_caster import FloorCaster
+from parallel import ParallelCaster
+from pipeline import RenderPipeline
+from profiler import PROFILER
+from quality import QualityController
+from textures import TextureCache
 
 
 def main() -> None:
@@ -27,21 +36,35 @@ def main() -> None:
     Handles user input, updates game objects, and draws to the screen."""
 
     def handle_events():
-        """Abstracted function: Handle all game events"""
+        """Abstracted function: Handle all game events, the player acts on
+        them and on the pressed keys in simulate"""
         running = True
         # get events
         events = pg.event.get()
         # get pressed keys
-        pressed = pg.key.get_pressed()
+        inputs["pressed"] = pg.key.get_pressed()
         for event in events:
             if event.type == pg.QUIT:
                 running = False
             if event.type == pg.KEYDOWN:
                 if event.key == pg.K_ESCAPE:
                     running = False
-        player.handle_event(events, pressed)
+        inputs["events"].extend(events)
         return running
 
+    def simulate(elapsed):
+        """Abstracted function: Advance the game by <elapsed> seconds in fixed
+        ticks of 1 / TICK_RATE seconds, the remainder is carried to the next frame"""
+        tick = 1 / constants.TICK_RATE
+        inputs["lag"] += min(elapsed, constants.MAX_FRAME_TIME)
+        while inputs["lag"] >= tick:
+            player.handle_event(inputs["events"], inputs["pressed"], tick)
+            # events are handled once, keys are held for every tick
+            inputs["events"] = []
+            if entities is not None:
+                entities.wander(grid, tick)
+            inputs["lag"] -= tick
+
     def clear_screen():
         """Abstracted function: Clear the game screen"""
         screen.fill((0, 0, 0))
@@ -56,15 +79,137 @@ def main() -> None:
         rect = pg.Rect((0, 0), (width, int(height / 2)))
         pg.draw.rect(screen, constants.CEILING, rect)
 
+    def render_frame(target, pose, step):
+        """Abstracted function: Cast rays and draw the entities into <target>
+        as seen from <pose>. Runs on the render thread, so no pygame calls"""
+        (origin, direction, plane) = pose
+        raycaster.render_columns(
+            target,
+            origin,
+            direction,
+            plane,
+            grid,
+            step=step,
+            batch=constants.BATCH,
+            cache=cache,
+            textures=textures,
+            floors=floors,
+        )
+        draw_entities(target, pose)
+
+    def draw_entities(target, pose):
+        """Abstracted function: Draw the entities over the walls of <target>"""
+        if entities is not None:
+            with PROFILER.stage("entities"):
+                entities.draw(target, *pose)
+            PROFILER.count("entities", entities.drawn)
+
+    def draw_framebuffer(pose, step, vscale, moved):
+        """Abstracted function: Render the frame of <pose> and blit it once.
+        The pipeline shows its last frame while this one is cast on its thread.
+        With vscale > 1 the walls are rendered at a lower height and scaled up."""
+        if caster is not None:
+            with PROFILER.stage("strips"):
+                steps = caster.render(
+                    *pose,
+                    step,
+                    overlay=None if entities is None else entities.version,
+                )
+            if steps:
+                PROFILER.count("rays", len(range(0, width, step)))
+                PROFILER.count("dda_steps", steps)
+                draw_entities(caster.framebuffer, pose)
+            blit_frame(caster.framebuffer, 1, moved, skipped=not steps)
+            return
+        pipeline.submit(pose, step, vscale)
+        if pipeline.front is None:
+            # nothing to show before the first frame
+            pipeline.wait()
+        frame = pipeline.front
+        blit_frame(frame.framebuffer, frame.vscale, frame.pose != shown[0])
+        shown[0] = frame.pose
+
+    def blit_frame(target, vscale, moved, skipped=False):
+        """Abstracted function: Blit <target>, rendered at 1 / <vscale> of the
+        height, to the screen. <skipped> if it still shows the last frame"""
+        # a textured floor moves with the camera, wherever the walls stay
+        flats_moved = floors is not None and floors.textured and moved
+        with PROFILER.stage("blit"):
+            pixels = target.pixels if packed_screen else target.rgb
+            if (
+                compositor is not None
+                and caster is None
+                and vscale == 1
+                and not flats_moved
+            ):
+                # only the columns that changed
+                compositor.update_walls(target, packed_screen)
+                return
+            if skipped and compositor is not None:
+                # the caster skipped an unchanged frame, the screen still shows it
+                return
+            if vscale == 1:
+                pg.surfarray.blit_array(screen, pixels)
+                if compositor is not None:
+                    compositor.mark_all(target, packed_screen)
+            else:
+                if vscale not in scaled:
+                    scaled[vscale] = pg.Surface(target.pixels.shape, 0, screen)
+                surface = scaled[vscale]
+                pg.surfarray.blit_array(surface, pixels)
+                pg.transform.scale(surface, size, screen)
+                if compositor is not None:
+                    compositor.mark_all()
+
+    def draw_minimap(moved):
+        """Abstracted function: Draw the minimap, when compositing only if it changed"""
+        if compositor is not None:
+            changed = moved or grid.version != mini_map.version
+            rect = mini_map.subwindow.get_rect()
+            if compositor.overlay("minimap", rect, changed) is None:
+                return
+        mini_map.draw(screen, grid, player)
+
     def draw_text():
         """Abstracted function: Draw game performance statistics"""
-        text = font.render(f"fps={int(clock.get_fps())}", False, (0, 255, 0))
-        screen.blit(text, (screen.get_rect().centerx, 0))
+        stats = f"fps={int(clock.get_fps())}"
+        if quality is not None:
+            stats += f" step={quality.step} vscale={quality.vscale}"
+        if cache is not None:
+            stats += f" cache hit={cache.hits} miss={cache.misses + cache.partial}"
+        elif caster is not None and caster.cache:
+            stats += f" cache hit={caster.hits} miss={caster.misses}"
+        lines = [(font, stats, 0)]
+        if PROFILER.enabled and constants.PROFILE_OVERLAY:
+            # stage times in ms and counters of the last frames
+            for row, line in enumerate(PROFILER.overlay_lines(), 1):
+                lines.append((mono_font, line, row * 14 + 6))
+        texts = [
+            (line_font.render(line, False, (0, 255, 0)), y)
+            for line_font, line, y in lines
+        ]
+        x = screen.get_rect().centerx
+        if compositor is not None:
+            rect = pg.Rect(x, 0, 0, 0).unionall(
+                [text.get_rect(topleft=(x, y)) for text, y in texts]
+            )
+            dirty = compositor.overlay("text", rect, lines != last_text[0])
+            last_text[0] = lines
+            if dirty is None:
+                return
+            # the old text may be larger than the new one
+            compositor.restore(dirty)
+        for text, y in texts:
+            screen.blit(text, (x, y))
 
     def update_display():
         """Abstracted function: Update game screen"""
-        # Flip the display
-        pg.display.flip()
+        if compositor is not None:
+            # only the regions that changed
+            compositor.present()
+        else:
+            # Flip the display
+            pg.display.flip()
 
     # Construct game objects
     player = game_objects.Player((3, 10))
@@ -72,79 +217,138 @@ def main() -> None:
     mini_map = game_objects.MiniMap()
     pg.init()
     font = pg.font.SysFont(pg.font.get_default_font(), 24)  # create font object
+    mono_font = pg.font.SysFont("monospace", 12)  # font of the profiler overlay
     clock = pg.time.Clock()     # create clock object
     # Set up the drawing window
     size = (width, height) = constants.SIZE
     screen = pg.display.set_mode(size)
+    # persistent pixel array, replaces the per column draw calls
+    use_framebuffer = constants.FRAMEBUFFER and not constants.SLOW
+    # strips are rendered by a process pool on wide windows, chunked maps are
+    # cast serially so they keep loading only the chunks that are seen
+    caster = pipeline = None
+    parallel = use_framebuffer and width >= constants.PARALLEL_WIDTH
+    if parallel and ParallelCaster.supports(grid):
+        caster = ParallelCaster(grid, width, height)
+    elif use_framebuffer:
+        # double buffered, the next frame is cast while the last one is shown
+        pipeline = RenderPipeline(render_frame, width, height)
+    # surfaces of the lower vertical resolutions
+    scaled = {}
+    # columns of the last frame, reused while the camera stands still
+    cache = ColumnCache() if constants.CACHE and caster is None else None
+    # shaded and scaled texture copies for textured walls
+    textures = TextureCache() if constants.TEXTURED and caster is None else None
+    # floor and ceiling cast row by row instead of two flat halves
+    floors = FloorCaster() if constants.FLATS and caster is None else None
+    # sprites drawn over the walls, hidden behind them by the depth buffer
+    entities = None
+    if constants.ENTITIES and use_framebuffer:
+        entities = EntityLayer.scatter(grid, constants.ENTITIES)
+    # ray step and vertical resolution that hold the frame budget while moving
+    quality = QualityController() if constants.ADAPTIVE else None
+    # dirty rectangle updates instead of redrawing and flipping everything
+    compositor = Compositor(screen) if constants.COMPOSITE else None
+    last_text = [None]
+    pose = None
+    # pose of the frame on screen
+    shown = [None]
+    # input not yet simulated and the time left over from the last ticks
+    inputs = {"events": [], "pressed": None, "lag": 0.0}
+    # packed pixels can be blit directly to 32 bit 0x00RRGGBB screens
+    packed_screen = screen.get_bitsize() == 32 and screen.get_shifts()[:3] == (16, 8, 0)
     # Main game LOOP
-    running = True
-    while running:
-        clock.tick(constants.FPS)
-        # HANDLE EVENTS
-        running = handle_events()  # Run until the user asks to quit
-        # DRAW
-        clear_screen()
-        draw_floor()
-        draw_celing()
-        # cast rays and draw walls
-        cast_rays(
-            screen,
-            player.xy,
-            player.direction,
-            player.plane,
-            grid,
-            width,
-            height,
-            step=constants.STEP,
-            slow=constants.SLOW,
-        )
-        # draw the minimap
-        mini_map.draw(screen, grid, player)
-        # draw fps
-        draw_text()
-        update_display()
+    try:
+        running = True
+        while running:
+            elapsed = clock.tick(constants.FPS) / 1000
+            frame_start = time.perf_counter()
+            (step, vscale) = (constants.STEP, 1)
+            if quality is not None:
+                (step, vscale) = (quality.step, quality.vscale)
+            with PROFILER.stage("total"):
+                # HANDLE EVENTS
+                with PROFILER.stage("events"):
+                    running = handle_events()  # Run until the user asks to quit
+                # UPDATE in fixed ticks
+                with PROFILER.stage("simulate"):
+                    simulate(elapsed)
+                last_pose = pose
+                # a snapshot, the player moves on while the frame is cast
+                pose = (player.xy, player.direction, player.plane)
+                # DRAW
+                if use_framebuffer:
+                    # floor, ceiling and walls in one blit
+                    draw_framebuffer(pose, step, vscale, moved=pose != last_pose)
+                else:
+                    with PROFILER.stage("background"):
+                        if compositor is not None:
+                            compositor.draw_background()
+                        else:
+                            clear_screen()
+                            draw_floor()
+                            draw_celing()
+                    # cast rays and draw walls
+                    cast_rays(
+                        screen,
+                        player.xy,
+                        player.direction,
+                        player.plane,
+                        grid,
+                        width,
+                        height,
+                        step=step,
+                        slow=constants.SLOW,
+                        batch=constants.BATCH,
+                        cache=cache,
+                    )
+                # draw the minimap
+                with PROFILER.stage("minimap"):
+                    draw_minimap(moved=pose != last_pose)
+                # draw fps
+                with PROFILER.stage("text"):
+                    draw_text()
+                with PROFILER.stage("display"):
+                    update_display()
+                if pipeline is not None:
+                    # the frame has to be done before the world changes again,
+                    # its stages overlap the ones above
+                    with PROFILER.stage("wait"):
+                        pipeline.wait()
+            PROFILER.end_frame()
+            if quality is not None:
+                frame_ms = (time.perf_counter() - frame_start) * 1e3
+                quality.update(frame_ms, moving=pose != last_pose)
+    finally:
+        if PROFILER.enabled and constants.PROFILE_DUMP:
+            PROFILER.dump(constants.PROFILE_DUMP)
+        # release the worker pool and its shared memory even on errors
+        if caster is not None:
+            caster.close()
+        if pipeline is not None:
+            pipeline.close()
 
 
 def cast_rays(
-    screen, origin, direction, plane, grid_dict, width, height, step=1, slow=False
+    screen,
+    origin,
+    direction,
+    plane,
+    grid,
+    width,
+    height,
+    step=1,
+    slow=False,
+    batch=False,
+    cache=None,
 ):
     """Cast rays perpendicular to <plane> in the direction of <direction> from <origin>.
     A ray is casted for every <step> taken from 0 to <width>.
     If a valid tile is hit by a row then the wall is drawn as a line.
-    If slow is True, the screen is drawn after every step."""
-
-    def get_ray(x, direction, plane, width):
-        """Construct a ray that is perpendicular to plane in the given direction
-        for given screen position on screen x-axis."""
-        camera_x = ((2 * x) / width) - 1
-        ray_dir = constants.Point2(
-            direction.x + (plane.x * camera_x),
-            direction.y + (plane.y * camera_x),
-        )
-        return ray_dir
-
-    def get_color(distance, side, element):
-        """Get the color for given element and darken color
-        depending on side hit and distance from start."""
-        color = constants.INT_TO_COLOR.get(element)
-        # dist -> depth -> darker
-        ratio = 1 - (1 / (distance + 1))
-        if side == 0:
-            # darken color
-            color = functions.darken_rgb(color, 50)
-        color = functions.darken_rgb(color, ratio * 150)
-        return color
-
-    def get_y_limits(distance, height):
-        """Get the start values of walls to be drawn along y-axis."""
-        line_height = height / distance
-        y_start = (-line_height + height) / 2
-        if y_start < 0:
-            y_start = 0
-        y_end = (line_height + height) / 2
-        if y_end >= height:
-            y_end = height - 1
-        return (y_start, y_end)
+    If slow is True, the screen is drawn after every step.
+    If batch is True, all rays are cast at once by vectorized.cast_columns
+    instead of calling raycaster.run_along_ray per column.
+    <cache> is passed on to raycaster.iter_columns."""
 
     def draw_wall(screen, color, x, y_limits, step, slow):
         """Draw section of a wall encountered by ray."""
@@ -156,121 +360,20 @@ def cast_rays(
                 pg.display.flip()
 
     assert step >= 1, "Step must be greater than 0"
-    # begin raycasting
-    for x in range(0, width, step):
-        ray = get_ray(x, direction, plane, width)
-        dist, side, element = run_along_ray(origin, ray, grid_dict)[:]
-        if side == -1:
-            # ray did not collide with anything, so move to next x coordinate
-            continue
-        color = get_color(dist, side, element)
-        y_limits = get_y_limits(dist, height)
-        draw_wall(screen, color, x, y_limits, step, slow)
-
-
-def run_along_ray(start, direction_ray, grid_dict):
-    """Apply the DDA from <start> along <direction_ray> until
-    a valid tile is encountered in <grid_dict> or max_iterations if reached.
-    The DDA algorithm decomposes <direction_ray> into side side distances
-    and takes integer steps along <direction_ray>. The algorithm
-    runs along the minimum x, y combination."""
-
-    def construct_deltas(ray_dir, pos, int_map):
-        """Construct <step>, <side_dist>, and <dist> delta pairs.
-        <step> represents an integer step along x/y.
-        <side_dist> represents the total distance along x/y.
-        <delta_dist> represents the distance along x/y that moves a
-        whole integer step."""
-        # ||ray_dir|| = 1 since ray_dir is normalized
-        # delta_dist = abs(||ray_dir||/ray_dir.x, ||ray_dir||/ray_dir.y)
-        # delta_dist = abs(1/ray_dir.x, 1/ray_dir.y)
-        # handle division by 0
-        INF_VAL = float("inf")
-        if ray_dir.x == 0 or ray_dir.y == 0:
-            if ray_dir.x == 0:
-                delta_dist = constants.Point2(INF_VAL, abs(1 / ray_dir.y))
-            else:
-                delta_dist = constants.Point2(abs(1 / ray_dir.x), INF_VAL)
-        else:
-            # no division by 0
-            delta_dist = constants.Point2(abs(1 / ray_dir.x), abs(1 / ray_dir.y))
-        # calculate step and initial side dist
-        if numerical.is_below(ray_dir.x, 0):
-            step_x = -1
-            side_dist_x = (pos.x - int_map[0]) * delta_dist.x
-        else:
-            step_x = 1
-            side_dist_x = (int_map[0] + 1.0 - pos.x) * delta_dist.x
-        if numerical.is_below(ray_dir.y, 0):
-            step_y = -1
-            side_dist_y = (pos.y - int_map[1]) * delta_dist.y
-        else:
-            step_y = 1
-            side_dist_y = (int_map[1] + 1.0 - pos.y) * delta_dist.y
-        side_dist = [side_dist_x, side_dist_y]
-        step = constants.Point2(step_x, step_y)
-        return step, side_dist, delta_dist
-
-    def hit_wall(int_map, grid_dict, max_iterations) -> bool:
-        """Check if a valid tile has been hit by ray or run
-        has iterated max_iterations times."""
-        element = grid_dict.setdefault(tuple(int_map), -1)
-        if element > 0 or max_iterations == 0:
-            # collision or max_iterations has been met
-            return True
-        return False
-
-    def calculate_wall_distance(side_dist, delta_dist, side) -> float:
-        """Calculates euclidean distance of <start> to intersection point.
-        Handles which side of a cube is hit. If no wall is hit returns infinity."""
-        if side == 0:
-            # side is vertical
-            perp_wall_dist = side_dist[0] - delta_dist.x
-        elif side == 1:
-            # side is horizontal
-            perp_wall_dist = side_dist[1] - delta_dist.y
-        else:
-            # side == -1
-            perp_wall_dist = float("inf")
-        return perp_wall_dist
-
-    # grid of integers
-    # start may be floats
-    # get the int values of the start xy
-    int_map = [int(start.x), int(start.y)]
-    (step, side_dist, delta_dist) = construct_deltas(direction_ray, start, int_map)
-    # perform DDA
-    max_iterations = 1e2
-    running = True
-    while running:
-        max_iterations -= 1
-        (side_dist, int_map, side) = walk_along_ray(
-            int_map, step, side_dist, delta_dist
-        )
-        if hit_wall(int_map, grid_dict, max_iterations):
-            running = False
-    element = grid_dict.get(tuple(int_map))
-    perp_wall_dist = calculate_wall_distance(side_dist, delta_dist, side)
-    return perp_wall_dist, side, element
-
-
-def walk_along_ray(int_map, step, side_dist, delta_dist):
-    """Take a <step> along a given ray by following a <delta_dist>.
-    Returns new <side_dist>, new <int_map>, and <side>."""
-    assert isinstance(int_map, list) and isinstance(
-        side_dist, list
-    ), "Must be a mutable (list) iterable!"
-    if numerical.is_below(side_dist[0], side_dist[1]):
-        # add to our x dist tracker
-        side_dist[0] += delta_dist.x
-        # take a step along x
-        int_map[0] += step.x
-        side = 0
-    else:
-        side_dist[1] += delta_dist.y
-        int_map[1] += step.y
-        side = 1
-    return side_dist, int_map, side
+    raycaster.SHADING.refresh()
+    # begin raycasting, all columns are cast before drawing starts
+    columns = raycaster.iter_columns(
+        origin, direction, plane, grid, width, step, batch, cache
+    )
+    with PROFILER.stage("draw"):
+        for x, dist, side, element in columns:
+            if side == -1:
+                # ray did not collide with anything, so move to next x coordinate
+                continue
+            color = raycaster.get_color(dist, side, element)
+            y_limits = raycaster.get_y_limits(dist, height)
+            draw_wall(screen, color, x, y_limits, step, slow)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Batched rendering of many cameras at once.
+The rays of every camera are cast together in one backends.march
+call over a shared grid and the frames are built as one (N, H, W, 3)
+array, so many low resolution observations are produced without a
+pygame surface or a loop over cameras.
+
+Usage:
+    views = render_views(origins, directions, planes, grid, 64, 48)
+    views.frames        # (N, 48, 64, 3) uint8, None with depth_only=True
+    views.depth         # (N, 64) perpendicular distance per column, inf for misses
+"""
+from __future__ import annotations
+
+from collections import namedtuple
+
+import numpy as np
+
+import backends
+import constants
+import distance_field
+import raycaster
+
+# results of render_views, frames is None when only depth was asked for
+Views = namedtuple("Views", "frames depth side element")
+
+
+def poses_from_players(players) -> tuple:
+    """Stack the poses of game_objects.Player like objects.
+    @return (origins, directions, planes), each an (N, 2) array."""
+    origins = np.array([(player.x, player.y) for player in players], dtype=float)
+    directions = np.array([tuple(player.direction) for player in players], dtype=float)
+    planes = np.array([tuple(player.plane) for player in players], dtype=float)
+    return origins, directions, planes
+
+
+def cast_views(
+    origins, directions, planes, grid, width, step=1, field=None, backend=None
+):
+    """Cast a ray for every <step> column of every camera in one batch with
+    backends.march(<backend>). <origins>, <directions> and <planes> are
+    (N, 2) arrays.
+    @return vectorized.Hits of shape (N, number of rays per camera)."""
+    (origins, directions, planes) = (
+        np.asarray(values, dtype=float).reshape(-1, 2)
+        for values in (origins, directions, planes)
+    )
+    # same rays as vectorized.get_rays, one row per camera
+    camera_x = ((2 * np.arange(0, width, step)) / width) - 1
+    ray_x = directions[:, 0:1] + (planes[:, 0:1] * camera_x)
+    ray_y = directions[:, 1:2] + (planes[:, 1:2] * camera_x)
+    return backends.march(backend)(
+        origins[:, 0:1],
+        origins[:, 1:2],
+        ray_x,
+        ray_y,
+        grid,
+        constants.VIEW_DISTANCE,
+        field or distance_field.for_grid(grid),
+    )
+
+
+def render_views(
+    origins, directions, planes, grid, width, height, step=1, depth_only=False
+) -> Views:
+    """Render N cameras of <width> x <height> over <grid>.
+    Frames are identical to what raycaster.render_columns draws into a
+    FrameBuffer, indexed as [camera, row, column, channel].
+    @return Views with frames, the depth of every screen column and the
+    side and element of the wall in it."""
+    hits = cast_views(origins, directions, planes, grid, width, step)
+    # every ray covers <step> screen columns
+    (depth, side, element) = (
+        np.repeat(values, step, axis=1)[:, :width]
+        for values in (hits.dist, hits.side, hits.element)
+    )
+    if depth_only:
+        return Views(None, depth, side, element)
+    raycaster.SHADING.refresh()
+    hit = side != -1
+    colors = np.zeros((*depth.shape, 3), dtype=np.uint8)
+    colors[hit] = raycaster.get_colors(depth[hit], side[hit], element[hit])
+    (y_start, y_end) = raycaster.get_y_spans(depth.ravel(), height)
+    # FrameBuffer.draw_columns rounds the spans down the same way
+    y_start = y_start.astype(int).reshape(depth.shape)[:, None, :]
+    y_end = y_end.astype(int).reshape(depth.shape)[:, None, :]
+    rows = np.arange(height)[None, :, None]
+    wall = (rows >= y_start) & (rows <= y_end)
+    background = np.empty((height, 3), dtype=np.uint8)
+    background[: height // 2] = constants.CEILING
+    background[height // 2:] = constants.FLOOR
+    frames = np.where(
+        wall[..., None], colors[:, None, :, :], background[None, :, None, :]
+    )
+    return Views(frames, depth, side, element)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import benchmark
+
+    parser = argparse.ArgumentParser(description="Measure observations per second")
+    parser.add_argument("--agents", type=int, default=256)
+    parser.add_argument("--size", type=int, nargs=2, default=(64, 48))
+    parser.add_argument("--map", type=int, default=256, help="synthetic map size")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--depth-only", action="store_true")
+    args = parser.parse_args()
+    world = benchmark.synthetic_grid(args.map)
+    paths = [
+        benchmark.camera_path(world, args.frames, seed) for seed in range(args.agents)
+    ]
+    (width, height) = args.size
+    elapsed = 0.0
+    for poses in zip(*paths):
+        (origins, directions, planes) = (
+            np.array([pose[i] for pose in poses]) for i in range(3)
+        )
+        start = time.perf_counter()
+        render_views(
+            origins, directions, planes, world, width, height,
+            depth_only=args.depth_only,
+        )
+        elapsed += time.perf_counter() - start
+    print(
+        f"{args.agents} agents at {width}x{height}: "
+        f"{args.agents * args.frames / elapsed:.0f} observations/sec"
+    )
@@ -6,6 +6,8 @@ from __future__ import annotations
 
 import math
 
+import numpy as np
+
 # default is 1e-9
 # lower the rel tol since pygame uses integers for pixel representation.
 # Extra precision on float is pointless otherwise.
@@ -13,6 +15,9 @@ import math
 REL_TOL = 1e-3
 # for values near 0
 ABS_TOL = 1e-3
+# precomputed for the fast and array predicates
+_INF = float("inf")
+_NEG_ABS_TOL = -ABS_TOL
 
 
 def is_close(a, b) -> bool:
@@ -77,6 +82,77 @@ def distance(start, end) -> float:
     return math.sqrt(sum(diff_sq))
 
 
+def fast_is_below(a, b, isclose=math.isclose) -> bool:
+    """is_below for two floats without the type dispatch of is_close.
+    The cheap a < b check runs first, so most calls never reach isclose.
+    Not usable for comparisons against the int 0, see fast_is_below_zero."""
+    return a < b and not isclose(a, b, rel_tol=REL_TOL)
+
+
+def fast_is_below_zero(a) -> bool:
+    """is_below(a, 0), with the absolute tolerance used for the int 0.
+    |a| <= ABS_TOL is close to 0, so this is a single comparison."""
+    return a < _NEG_ABS_TOL
+
+
+def fast_is_close(a, b, isclose=math.isclose) -> bool:
+    """is_close for two floats without the type dispatch.
+    Not usable for comparisons against the int 0."""
+    return isclose(a, b, rel_tol=REL_TOL)
+
+
+def _uses_abs_tol(b) -> bool:
+    """is_close only adds the absolute tolerance when comparing to the int 0."""
+    return isinstance(b, int) and not isinstance(b, bool) and b == 0
+
+
+def array_is_close(a, b) -> np.ndarray:
+    """is_close element wise over arrays (or scalars) of floats."""
+    a = np.asarray(a, dtype=float)
+    tol_abs = ABS_TOL if _uses_abs_tol(b) else 0.0
+    b = np.asarray(b, dtype=float)
+    with np.errstate(invalid="ignore", over="ignore"):
+        diff = np.abs(a - b)
+        tol = np.maximum(np.maximum(REL_TOL * np.abs(a), REL_TOL * np.abs(b)), tol_abs)
+        return (a == b) | ((diff <= tol) & (diff < _INF))
+
+
+def array_is_below(a, b) -> np.ndarray:
+    """is_below element wise over arrays (or scalars) of floats."""
+    if _uses_abs_tol(b):
+        return np.asarray(a, dtype=float) < _NEG_ABS_TOL
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    with np.errstate(invalid="ignore", over="ignore"):
+        diff = b - a
+        tol = np.maximum(REL_TOL * np.abs(a), REL_TOL * np.abs(b))
+        return (a < b) & ((diff > tol) | (diff == _INF))
+
+
+def array_is_above(a, b) -> np.ndarray:
+    """is_above element wise over arrays (or scalars) of floats."""
+    if _uses_abs_tol(b):
+        return np.asarray(a, dtype=float) > ABS_TOL
+    return array_is_below(b, a)
+
+
+def array_is_below_or_eq(a, b) -> np.ndarray:
+    """is_below_or_eq element wise over arrays (or scalars) of floats."""
+    return array_is_close(a, b) | (np.asarray(a, dtype=float) < np.asarray(b))
+
+
+def array_is_above_or_eq(a, b) -> np.ndarray:
+    """is_above_or_eq element wise over arrays (or scalars) of floats."""
+    return array_is_close(a, b) | (np.asarray(a, dtype=float) > np.asarray(b))
+
+
+def array_is_in(val, lower, upper, inclusive=True) -> np.ndarray:
+    """is_in element wise over arrays (or scalars) of floats."""
+    if inclusive:
+        return array_is_above_or_eq(val, lower) & array_is_below_or_eq(val, upper)
+    return array_is_above(val, lower) & array_is_below(val, upper)
+
+
 if __name__ == "__main__":
     x = 0.3333
     y = 0.3233
@@ -0,0 +1,185 @@
+"""Offline renderer for camera trajectories.
+Renders a sequence of camera poses without pygame or a window, as fast as
+the machine allows, and streams the frames out one at a time as raw RGB
+or numbered PPM images. Only one frame is held in memory, however long
+the trajectory is.
+
+A pose file holds one pose per line, "x y direction_x direction_y plane_x plane_y",
+separated by spaces or commas. Empty lines and lines starting with # are skipped.
+
+Usage:
+    python offline.py poses.txt --out frames/       # frames/frame_000000.ppm, ...
+    python offline.py poses.txt --raw - | ffmpeg -f rawvideo -pix_fmt rgb24 \
+        -s 600x600 -i - out.mp4
+    python offline.py --path 10000 --size 640 480   # scripted path, frames/sec
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+import constants
+import grid
+import raycaster
+from chunked_map import ChunkedGrid
+from column_cache import ColumnCache
+from dense_grid import DenseGrid
+from entities import EntityLayer
+from floor_caster import FloorCaster
+from framebuffer import FrameBuffer
+from textures import TextureCache
+
+
+def read_poses(path):
+    """Lazily yield (origin, direction, plane) from the pose file at <path>."""
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            values = [float(value) for value in line.replace(",", " ").split()]
+            assert len(values) == 6, f"{path}:{number} is not a pose of 6 numbers!"
+            yield (
+                constants.Point2(*values[0:2]),
+                constants.Point2(*values[2:4]),
+                constants.Point2(*values[4:6]),
+            )
+
+
+def render_frames(
+    poses,
+    grid,
+    width,
+    height,
+    step=1,
+    batch=True,
+    cache=True,
+    textured=constants.TEXTURED,
+    flats=constants.FLATS,
+    textured_flats=constants.TEXTURED_FLATS,
+    entities=None,
+):
+    """Render every (origin, direction, plane) in <poses> into one FrameBuffer,
+    with textured walls if <textured> is True and a cast floor and ceiling
+    if <flats> is True, textured if <textured_flats> is True. The
+    entities.EntityLayer <entities> is drawn over every frame.
+    Yields the same FrameBuffer for every frame, it is overwritten by the
+    next frame so copy the pixels to keep them."""
+    framebuffer = FrameBuffer(width, height)
+    column_cache = ColumnCache() if cache else None
+    textures = TextureCache() if textured else None
+    floors = FloorCaster(textured_flats) if flats else None
+    for pose in poses:
+        (origin, direction, plane) = (constants.Point2(*xy) for xy in pose)
+        raycaster.render_columns(
+            framebuffer,
+            origin,
+            direction,
+            plane,
+            grid,
+            step=step,
+            batch=batch,
+            cache=column_cache,
+            textures=textures,
+            floors=floors,
+        )
+        if entities is not None:
+            entities.draw(framebuffer, origin, direction, plane)
+        yield framebuffer
+
+
+def rgb_bytes(framebuffer) -> bytes:
+    """Pixels of <framebuffer> as rgb24 bytes, row by row from the top."""
+    return framebuffer.rgb.transpose(1, 0, 2).tobytes()
+
+
+def write_raw(frames, stream) -> int:
+    """Write every frame to the binary <stream> as raw rgb24.
+    @return int: how many frames were written."""
+    count = 0
+    for framebuffer in frames:
+        stream.write(rgb_bytes(framebuffer))
+        count += 1
+    return count
+
+
+def write_images(frames, directory, pattern="frame_{:06d}.ppm") -> int:
+    """Write every frame to <directory> as a binary PPM named by <pattern>.
+    @return int: how many frames were written."""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for count, framebuffer in enumerate(frames, 1):
+        header = f"P6\n{framebuffer.width} {framebuffer.height}\n255\n".encode()
+        with open(os.path.join(directory, pattern.format(count - 1)), "wb") as file:
+            file.write(header + rgb_bytes(framebuffer))
+    return count
+
+
+def consume(frames) -> int:
+    """Render every frame without writing it anywhere.
+    @return int: how many frames were rendered."""
+    return sum(1 for _ in frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("poses", nargs="?", help="pose file to render")
+    parser.add_argument(
+        "--path", type=int, metavar="FRAMES",
+        help="render the scripted camera path of benchmark.py instead of a pose file",
+    )
+    parser.add_argument("--map", help="chunked map file, grid.GRID by default")
+    parser.add_argument("--size", type=int, nargs=2, default=constants.SIZE)
+    parser.add_argument("--step", type=int, default=constants.STEP)
+    parser.add_argument("--column", action="store_true", help="cast column by column")
+    parser.add_argument("--textured", action="store_true", help="draw textured walls")
+    parser.add_argument(
+        "--entities", type=int, default=0, help="still entities scattered over the map"
+    )
+    parser.add_argument(
+        "--flats", choices=("shaded", "textured"), help="cast the floor and ceiling"
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--out", help="directory to write numbered PPM images to")
+    output.add_argument("--raw", help="file to write raw rgb24 frames to, - is stdout")
+    args = parser.parse_args()
+    if (args.poses is None) == (args.path is None):
+        parser.error("give either a pose file or --path")
+    world = DenseGrid(grid.GRID) if args.map is None else ChunkedGrid(args.map)
+    if args.path is None:
+        poses = read_poses(args.poses)
+    else:
+        import benchmark
+
+        poses = benchmark.camera_path(world, args.path)
+    (width, height) = args.size
+    frames = render_frames(
+        poses,
+        world,
+        width,
+        height,
+        args.step,
+        batch=not args.column,
+        textured=args.textured or constants.TEXTURED,
+        flats=args.flats is not None or constants.FLATS,
+        textured_flats=args.flats == "textured" or constants.TEXTURED_FLATS,
+        entities=EntityLayer.scatter(world, args.entities) if args.entities else None,
+    )
+    start = time.perf_counter()
+    if args.out:
+        count = write_images(frames, args.out)
+    elif args.raw == "-":
+        count = write_raw(frames, sys.stdout.buffer)
+    elif args.raw:
+        with open(args.raw, "wb") as file:
+            count = write_raw(frames, file)
+    else:
+        count = consume(frames)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} frames of {width}x{height} in {elapsed:.2f}s, "
+        f"{count / elapsed:.1f} frames/sec",
+        file=sys.stderr,
+    )
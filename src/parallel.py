@@ -0,0 +1,233 @@
+"""Multi-core rendering of a frame in vertical strips.
+Every screen column is independent, so the frame is split into strips that
+a persistent pool of worker processes casts and draws in parallel.
+The grid and the frame live in shared memory, per frame only the camera
+pose and the strip bounds are sent to the workers."""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import constants
+import distance_field
+import raycaster
+import shading
+from dense_grid import DenseGrid
+from floor_caster import FloorCaster
+from framebuffer import FrameBuffer
+from textures import TextureCache
+
+# state of a worker process, set once by _attach
+_worker = {}
+
+
+def _attach(
+    grid_name,
+    grid_shape,
+    grid_dtype,
+    field_name,
+    radius,
+    frame_name,
+    width,
+    height,
+    textured,
+    flats,
+) -> None:
+    """Worker initializer: map the shared grid, distance field and frame
+    into this process. Textures and the floor caster are kept per worker,
+    <flats> is None without floor casting, else whether it is textured."""
+    grid_memory = shared_memory.SharedMemory(name=grid_name)
+    frame_memory = shared_memory.SharedMemory(name=frame_name)
+    grid_array = np.ndarray(grid_shape, dtype=grid_dtype, buffer=grid_memory.buf)
+    _worker["memory"] = [grid_memory, frame_memory]
+    _worker["grid"] = DenseGrid(
+        grid_array, read_only=True, dtype=grid_dtype, copy=False
+    )
+    _worker["field"] = None
+    if field_name is not None:
+        # the parent keeps the field in sync with the grid
+        field_memory = shared_memory.SharedMemory(name=field_name)
+        _worker["memory"].append(field_memory)
+        values = np.ndarray(grid_shape, dtype=np.uint8, buffer=field_memory.buf)
+        _worker["field"] = distance_field.DistanceField(
+            _worker["grid"], radius, values=values
+        )
+    # the parent clears the frame once, other workers may already be drawing
+    _worker["framebuffer"] = FrameBuffer(
+        width, height, buffer=frame_memory.buf, clear=False
+    )
+    _worker["textures"] = TextureCache() if textured else None
+    _worker["floors"] = None if flats is None else FloorCaster(flats)
+
+
+def _render_strip(task) -> int:
+    """Worker task: cast and draw the columns [start, stop) of a frame.
+    @return int: how many DDA steps were taken."""
+    (palette, origin, direction, plane, step, start, stop) = task
+    framebuffer = _worker["framebuffer"]
+    # follow palette changes made in the parent process
+    if raycaster.SHADING.refresh(palette):
+        (_, ceiling, floor) = palette
+        framebuffer.set_background(ceiling, floor, clear=False)
+    columns = raycaster.render_columns(
+        framebuffer,
+        constants.Point2(*origin),
+        constants.Point2(*direction),
+        constants.Point2(*plane),
+        _worker["grid"],
+        step=step,
+        start=start,
+        stop=stop,
+        palette=palette,
+        field=_worker["field"],
+        textures=_worker["textures"],
+        floors=_worker["floors"],
+    )
+    return int(columns.steps.sum())
+
+
+class ParallelCaster:
+    """Renders frames of <width> x <height> of a DenseGrid <grid> on <workers>
+    processes, <strip> columns per task. workers=0 uses every core.
+    The finished frame is in <framebuffer>, which is backed by shared memory.
+    With <cache>, a frame with the same pose, palette and grid as the last one
+    is not rendered again, <hits> and <misses> count those frames.
+    With <textured> the workers draw textured walls and with <flats> they
+    cast the floor and ceiling, textured with <textured_flats>."""
+
+    def __init__(
+        self,
+        grid,
+        width,
+        height,
+        workers=constants.WORKERS,
+        strip=constants.STRIP,
+        cache=constants.CACHE,
+        textured=constants.TEXTURED,
+        flats=constants.FLATS,
+        textured_flats=constants.TEXTURED_FLATS,
+    ) -> None:
+        assert self.supports(grid), "Only a DenseGrid can be rendered in parallel!"
+        self.grid = grid
+        self.cache = cache
+        self.hits = self.misses = 0
+        self.last = None
+        self.width, self.height = width, height
+        self.workers = workers or os.cpu_count()
+        self.strip = strip
+        self.version = grid.version
+        self._grid_memory = shared_memory.SharedMemory(
+            create=True, size=max(grid.array.nbytes, 1)
+        )
+        self._grid_array = np.ndarray(
+            grid.shape, dtype=grid.array.dtype, buffer=self._grid_memory.buf
+        )
+        self._grid_array[:] = grid.array
+        # the distance field is synced here and shared, workers never rebuild it
+        self.field = distance_field.for_grid(grid)
+        self._field_memory = None
+        if self.field is not None:
+            self._field_memory = shared_memory.SharedMemory(
+                create=True, size=max(self.field.values.nbytes, 1)
+            )
+            self._field_array = np.ndarray(
+                grid.shape, dtype=np.uint8, buffer=self._field_memory.buf
+            )
+            self._field_array[:] = self.field.values
+        # the pixels followed by the depth buffer
+        self._frame_memory = shared_memory.SharedMemory(
+            create=True, size=width * (height + 1) * 4
+        )
+        self.framebuffer = FrameBuffer(width, height, buffer=self._frame_memory.buf)
+        self.palette = shading.current_palette()
+        # spawn so workers never inherit the pygame display
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(
+            self.workers,
+            initializer=_attach,
+            initargs=(
+                self._grid_memory.name,
+                grid.shape,
+                grid.array.dtype.str,
+                self._field_memory and self._field_memory.name,
+                self.field and self.field.radius,
+                self._frame_memory.name,
+                width,
+                height,
+                textured,
+                textured_flats if flats else None,
+            ),
+        )
+
+    @staticmethod
+    def supports(grid) -> bool:
+        """Whether <grid> can be shared with the workers, only a DenseGrid
+        has the one array that is copied into shared memory."""
+        return hasattr(grid, "array")
+
+    def sync_grid(self) -> None:
+        """Copy grid writes made since the last frame, and the distance field
+        they change, into shared memory."""
+        if self.grid.version == self.version:
+            return
+        changes = self.grid.changes_since(self.version)
+        if changes is None:
+            self._grid_array[:] = self.grid.array
+        else:
+            for x, y in changes:
+                self._grid_array[x, y] = self.grid[(x, y)]
+        if self.field is not None:
+            self.field.sync()
+            self._field_array[:] = self.field.values
+        self.version = self.grid.version
+
+    def render(self, origin, direction, plane, step=1, overlay=None) -> int:
+        """Render one frame into <framebuffer>. <overlay> identifies what the
+        caller draws over the frame afterwards, e.g. EntityLayer.version,
+        a frame is only reused under the same overlay.
+        @return int: how many DDA steps were taken."""
+        assert step >= 1, "Step must be greater than 0"
+        self.sync_grid()
+        # strips start on a multiple of step so every ray keeps its column
+        strip = max(self.strip // step, 1) * step
+        # the palette is sent along so workers shade with the parent's colors
+        palette = shading.current_palette()
+        if palette != self.palette:
+            (_, ceiling, floor) = palette
+            self.framebuffer.set_background(ceiling, floor, clear=False)
+            self.palette = palette
+        pose = (tuple(origin), tuple(direction), tuple(plane))
+        if self.cache and (pose, step, palette, self.version, overlay) == self.last:
+            # the shared frame still holds this frame
+            self.hits += 1
+            return 0
+        self.misses += 1
+        self.last = (pose, step, palette, self.version, overlay)
+        tasks = [
+            (palette, *pose, step, start, min(start + strip, self.width))
+            for start in range(0, self.width, strip)
+        ]
+        return sum(self.pool.map(_render_strip, tasks, chunksize=1))
+
+    def close(self) -> None:
+        """Stop the workers and release the shared memory."""
+        self.pool.terminate()
+        self.pool.join()
+        # drop the views before releasing the buffers they point into
+        del self.framebuffer, self._grid_array
+        memories = [self._grid_memory, self._frame_memory]
+        if self._field_memory is not None:
+            del self._field_array
+            memories.append(self._field_memory)
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,74 @@
+"""Pipelined rendering of the framebuffer path.
+Every frame is rendered into the one of two FrameBuffers that is not on
+screen, from a snapshot of the camera taken when the frame was started.
+On a worker thread the next frame is cast while the main thread presents
+the last one, numpy and the numba kernel release the GIL in their loops,
+so both run on their own core. The screen lags the simulation by a frame."""
+from __future__ import annotations
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import constants
+from framebuffer import FrameBuffer
+
+# a rendered frame, with the camera <pose> (origin, direction, plane) and
+# the <step> and <vscale> it was rendered at
+Frame = namedtuple("Frame", "framebuffer pose step vscale")
+
+
+class RenderPipeline:
+    """Double buffered frames of <width> x <height> rendered by
+    <render>(framebuffer, pose, step), which must not touch pygame.
+    <front> is the last finished Frame, None before the first one.
+    With <threaded> frames are rendered on a worker thread, otherwise
+    submit renders the frame right away."""
+
+    def __init__(self, render, width, height, threaded=constants.PIPELINE) -> None:
+        self.render = render
+        self.width, self.height = width, height
+        self.threaded = threaded
+        self.front = None
+        # two framebuffers per vertical scale, the front one and the back one
+        self.buffers = {}
+        self._pending = None
+        self._executor = None
+        if threaded:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="render")
+
+    def back_buffer(self, vscale) -> FrameBuffer:
+        """The framebuffer at 1 / <vscale> of the height that is not on screen."""
+        if vscale not in self.buffers:
+            low = (self.width, self.height // vscale)
+            self.buffers[vscale] = (FrameBuffer(*low), FrameBuffer(*low))
+        (first, second) = self.buffers[vscale]
+        shown = self.front and self.front.framebuffer
+        return second if first is shown else first
+
+    def submit(self, pose, step=1, vscale=1) -> None:
+        """Start rendering the camera <pose>, a snapshot the caller does not
+        change, into the back buffer. The world may not change until wait."""
+        assert self._pending is None, "Wait for the last frame before the next one!"
+        frame = Frame(self.back_buffer(vscale), pose, step, vscale)
+        if self._executor is None:
+            self.render(frame.framebuffer, pose, step)
+            self.front = frame
+            return
+        future = self._executor.submit(self.render, frame.framebuffer, pose, step)
+        self._pending = (frame, future)
+
+    def wait(self) -> Frame | None:
+        """Wait for the submitted frame, which becomes the front frame,
+        errors of the worker are raised here.
+        @return the front Frame."""
+        if self._pending is not None:
+            (frame, future) = self._pending
+            self._pending = None
+            future.result()
+            self.front = frame
+        return self.front
+
+    def close(self) -> None:
+        """Finish the submitted frame and stop the worker."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
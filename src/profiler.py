@@ -0,0 +1,126 @@
+"""Per stage frame profiler.
+Stages of a frame are timed with PROFILER.stage(name) and work is counted
+with PROFILER.count(name, value). end_frame() closes a frame and keeps its
+numbers in a rolling window, from which percentiles, histograms, an
+overlay and CSV/JSON dumps are made. A disabled profiler hands out one
+shared null context, so instrumented code costs next to nothing."""
+from __future__ import annotations
+
+import contextlib
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+import constants
+
+_NULL = contextlib.nullcontext()
+
+
+class _Timer:
+    """Context manager that adds the time spent in it to a stage."""
+
+    __slots__ = ("frame", "name", "start")
+
+    def __init__(self, frame, name) -> None:
+        self.frame = frame
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = (time.perf_counter() - self.start) * 1e3
+        self.frame[self.name] = self.frame.get(self.name, 0.0) + elapsed
+
+
+class Profiler:
+    """Collects stage times in milliseconds and counters per frame.
+    The last <window> frames are kept. steps_per_ray is derived from the
+    dda_steps and rays counters of every frame."""
+
+    def __init__(self, enabled=constants.PROFILE, window=constants.PROFILE_WINDOW):
+        self.enabled = enabled
+        self.frames = deque(maxlen=window)
+        self._frame = {}
+
+    def stage(self, name):
+        """Context manager timing the stage <name>, stages may be nested."""
+        if not self.enabled:
+            return _NULL
+        return _Timer(self._frame, name)
+
+    def count(self, name, value) -> None:
+        """Add <value> to the counter <name> of the current frame."""
+        if self.enabled:
+            self._frame[name] = self._frame.get(name, 0) + value
+
+    def end_frame(self) -> None:
+        """Close the current frame and start a new one."""
+        if not self.enabled:
+            return
+        frame = self._frame
+        if frame.get("rays"):
+            frame["steps_per_ray"] = frame.get("dda_steps", 0) / frame["rays"]
+        self.frames.append(frame)
+        self._frame = {}
+
+    def names(self) -> list:
+        """Every stage and counter seen in the window, in order of appearance."""
+        names = {}
+        for frame in self.frames:
+            names.update(dict.fromkeys(frame))
+        return list(names)
+
+    def samples(self, name) -> np.ndarray:
+        """Value of <name> in every frame of the window, 0 where it was not used."""
+        return np.array([frame.get(name, 0) for frame in self.frames], dtype=float)
+
+    def summary(self) -> dict:
+        """p50, p95, p99 and mean of every stage and counter over the window."""
+        summary = {}
+        for name in self.names():
+            samples = self.samples(name)
+            (p50, p95, p99) = np.percentile(samples, [50, 95, 99])
+            summary[name] = {
+                "p50": p50, "p95": p95, "p99": p99, "mean": samples.mean()
+            }
+        return summary
+
+    def histogram(self, name, bins=10) -> tuple:
+        """Rolling histogram of <name>, see numpy.histogram.
+        @return (counts, bin edges)."""
+        return np.histogram(self.samples(name), bins=bins)
+
+    def overlay_lines(self) -> list:
+        """One line of text per stage and counter for an on screen overlay."""
+        lines = [f"{'':>13} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for name, stats in self.summary().items():
+            lines.append(
+                f"{name:>13} {stats['p50']:>8.2f} {stats['p95']:>8.2f} "
+                f"{stats['p99']:>8.2f}"
+            )
+        return lines
+
+    def dump(self, path) -> None:
+        """Write the window to <path>, as CSV with one row per frame if the
+        path ends in .csv, otherwise as JSON with the summary and every sample."""
+        names = self.names()
+        with open(path, "w", newline="") as file:
+            if path.endswith(".csv"):
+                writer = csv.writer(file)
+                writer.writerow(["frame", *names])
+                for number, frame in enumerate(self.frames):
+                    writer.writerow([number, *(frame.get(name, 0) for name in names)])
+            else:
+                samples = {name: self.samples(name).tolist() for name in names}
+                json.dump(
+                    {"summary": self.summary(), "samples": samples}, file, indent=2
+                )
+
+
+# shared profiler of the game, enable it with constants.PROFILE
+PROFILER = Profiler()
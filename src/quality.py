@@ -0,0 +1,91 @@
+"""Adaptive render quality.
+Lowers the horizontal resolution (the ray step) and then the vertical
+resolution of the walls while frames take longer than the frame budget,
+and raises them again once there is time to spare. Changes need several
+frames in a row beyond a threshold and a pause after every change, so the
+quality does not flicker between two levels."""
+from __future__ import annotations
+
+import constants
+
+
+class QualityController:
+    """Picks a quality level from LEVELS for a frame budget of 1000 / <fps> ms.
+    Only moving frames are adapted, as soon as the camera stands still the
+    full quality level 0 is used. <level> is kept while standing still so
+    moving again starts at a level that held the budget."""
+
+    # (step multiplier, vertical scale), from full to lowest quality
+    LEVELS = ((1, 1), (2, 1), (2, 2), (3, 2), (4, 2), (4, 4))
+    SMOOTHING = 0.2                 # weight of the newest frame in the average
+    SLOW = 0.95                     # lower quality above this part of the budget
+    FAST = 0.6                      # raise quality below this part of the budget
+    PATIENCE = 10                   # frames in a row needed to change the level
+    COOLDOWN = 30                   # frames after a change without another change
+    RETRY = 180                     # frames before retrying a level that was too slow
+
+    def __init__(self, fps=constants.FPS, step=constants.STEP, max_vscale=4) -> None:
+        self.budget = 1000 / fps
+        self.base_step = step
+        self.levels = [level for level in self.LEVELS if level[1] <= max_vscale]
+        self.level = 0
+        self.moving = False
+        self.average = None
+        self.slow = self.fast = 0
+        self.cooldown = 0
+        self.frame = 0
+        # level -> frame at which it was left for being too slow
+        self.too_slow = {}
+
+    @property
+    def active(self) -> int:
+        """Level the next frame is rendered at."""
+        return self.level if self.moving else 0
+
+    @property
+    def step(self) -> int:
+        """Ray step to render the next frame with."""
+        return self.base_step * self.levels[self.active][0]
+
+    @property
+    def vscale(self) -> int:
+        """Walls are rendered at 1 / vscale of the height and scaled up."""
+        return self.levels[self.active][1]
+
+    def update(self, frame_ms, moving) -> None:
+        """Feed the time the last frame took and whether the camera moved."""
+        self.frame += 1
+        was_moving = self.moving
+        self.moving = moving
+        if not (moving and was_moving):
+            # still frames are rendered at full quality and say nothing
+            # about the time of a moving frame
+            self.average = None
+            self.slow = self.fast = 0
+            return
+        if self.average is None:
+            self.average = frame_ms
+        else:
+            weight = self.SMOOTHING
+            self.average = (1 - weight) * self.average + weight * frame_ms
+        if self.cooldown:
+            self.cooldown -= 1
+            return
+        # count frames in a row beyond either threshold
+        self.slow = self.slow + 1 if self.average > self.SLOW * self.budget else 0
+        self.fast = self.fast + 1 if self.average < self.FAST * self.budget else 0
+        if self.slow >= self.PATIENCE and self.level < len(self.levels) - 1:
+            self.too_slow[self.level] = self.frame
+            self.change(self.level + 1)
+        elif self.fast >= self.PATIENCE and self.level > 0:
+            # do not bounce straight back to a level that could not keep up
+            left = self.too_slow.get(self.level - 1)
+            if left is None or self.frame - left >= self.RETRY:
+                self.change(self.level - 1)
+
+    def change(self, level) -> None:
+        self.level = level
+        self.slow = self.fast = 0
+        self.cooldown = self.COOLDOWN
+        # frames at the new level take a different time
+        self.average = None
@@ -0,0 +1,314 @@
+"""Headless raycasting core.
+Holds the DDA algorithm (run_along_ray, walk_along_ray) and the per column
+math used by main.cast_rays, so rays can be cast and timed without pygame
+or a window. main only draws the results of this module.
+"""
+import numpy as np
+
+import backends
+import constants
+import distance_field
+import numerical
+import vectorized
+from profiler import PROFILER
+from shading import ShadingTable
+
+# shared wall colors, call SHADING.refresh() once per frame to pick up palette changes
+SHADING = ShadingTable()
+
+
+def get_ray(x, direction, plane, width):
+    """Construct a ray that is perpendicular to plane in the given direction
+    for given screen position on screen x-axis."""
+    camera_x = ((2 * x) / width) - 1
+    ray_dir = constants.Point2(
+        direction.x + (plane.x * camera_x),
+        direction.y + (plane.y * camera_x),
+    )
+    return ray_dir
+
+
+def get_color(distance, side, element):
+    """Get the color for given element and darken color
+    depending on side hit and distance from start."""
+    return SHADING.lookup(distance, side, element)
+
+
+def get_y_limits(distance, height):
+    """Get the start values of walls to be drawn along y-axis."""
+    line_height = height / distance
+    y_start = (-line_height + height) / 2
+    if y_start < 0:
+        y_start = 0
+    y_end = (line_height + height) / 2
+    if y_end >= height:
+        y_end = height - 1
+    return (y_start, y_end)
+
+
+def get_colors(distance, side, element) -> np.ndarray:
+    """Vectorized get_color over arrays of columns.
+    @return (n, 3) uint8 array of colors."""
+    return SHADING.gather(distance, side, element)
+
+
+def get_y_spans(distance, height):
+    """Vectorized get_y_limits over an array of distances.
+    Returns the first and last row of every wall, rays that hit
+    nothing get y_start > y_end."""
+    with np.errstate(divide="ignore"):
+        line_height = height / distance
+    y_start = np.maximum((-line_height + height) / 2, 0)
+    y_end = np.minimum((line_height + height) / 2, height - 1)
+    y_start[np.isinf(distance)] = height
+    return y_start, y_end
+
+
+def iter_columns(
+    origin, direction, plane, grid, width, step=1, batch=False, cache=None
+):
+    """Iterate (x, distance, side, element) for every <step> column from 0 to <width>.
+    The rays are cast when called by cast_columns, with the vectorized DDA if
+    batch is True and by run_along_ray one column at a time otherwise.
+    A column_cache.ColumnCache <cache> reuses the columns of earlier frames."""
+    assert step >= 1, "Step must be greater than 0"
+    cast = cast_columns if cache is None else cache.cast_columns
+    columns = cast(origin, direction, plane, grid, width, step, batch)
+    return zip(
+        range(0, width, step),
+        columns.dist.tolist(),
+        columns.side.tolist(),
+        columns.element.tolist(),
+    )
+
+
+def cast_columns(
+    origin,
+    direction,
+    plane,
+    grid,
+    width,
+    step=1,
+    batch=False,
+    start=0,
+    stop=None,
+    field=None,
+    backend=None,
+):
+    """Cast a ray for every <step> column from <start> to <stop> (0 to <width>
+    by default) without drawing.
+    The batch path casts with backends.get(<backend>) and skips empty space with <field>,
+    distance_field.for_grid(grid) by default, the per column path walks every
+    tile and serves as the reference.
+    Returns vectorized.Columns for either casting path so results can be compared."""
+    assert step >= 1, "Step must be greater than 0"
+    stop = width if stop is None else stop
+    if batch:
+        return vectorized.cast_columns(
+            origin,
+            direction,
+            plane,
+            grid,
+            width,
+            step,
+            start=start,
+            stop=stop,
+            field=field or distance_field.for_grid(grid),
+            backend=backends.get(backend),
+        )
+    with PROFILER.stage("ray_setup"):
+        rays = [get_ray(x, direction, plane, width) for x in range(start, stop, step)]
+    with PROFILER.stage("dda"):
+        results = [run_along_ray(origin, ray, grid) for ray in rays]
+    (dist, side, element, steps) = zip(*results) if results else ((), (), (), ())
+    return vectorized.Columns(
+        np.array(dist, dtype=float),
+        np.array(side, dtype=np.int8),
+        np.array(element, dtype=np.int16),
+        np.array(steps, dtype=int),
+    )
+
+
+def run_along_ray(start, direction_ray, grid, max_distance=constants.VIEW_DISTANCE):
+    """Apply the DDA from <start> along <direction_ray> until
+    a valid tile is encountered in <grid>, the ray travelled further than
+    <max_distance> or it left the grid.
+    The DDA algorithm decomposes <direction_ray> into side side distances
+    and takes integer steps along <direction_ray>. The algorithm
+    runs along the minimum x, y combination.
+    Returns the perpendicular distance, side and element of the hit
+    and how many steps were taken."""
+
+    def construct_deltas(ray_dir, pos, int_map):
+        """Construct <step>, <side_dist>, and <dist> delta pairs.
+        <step> represents an integer step along x/y.
+        <side_dist> represents the total distance along x/y.
+        <delta_dist> represents the distance along x/y that moves a
+        whole integer step."""
+        # ||ray_dir|| = 1 since ray_dir is normalized
+        # delta_dist = abs(||ray_dir||/ray_dir.x, ||ray_dir||/ray_dir.y)
+        # delta_dist = abs(1/ray_dir.x, 1/ray_dir.y)
+        # handle division by 0
+        INF_VAL = float("inf")
+        if ray_dir.x == 0 or ray_dir.y == 0:
+            if ray_dir.x == 0:
+                delta_dist = constants.Point2(INF_VAL, abs(1 / ray_dir.y))
+            else:
+                delta_dist = constants.Point2(abs(1 / ray_dir.x), INF_VAL)
+        else:
+            # no division by 0
+            delta_dist = constants.Point2(abs(1 / ray_dir.x), abs(1 / ray_dir.y))
+        # calculate step and initial side dist
+        if numerical.fast_is_below_zero(ray_dir.x):
+            step_x = -1
+            side_dist_x = (pos.x - int_map[0]) * delta_dist.x
+        else:
+            step_x = 1
+            side_dist_x = (int_map[0] + 1.0 - pos.x) * delta_dist.x
+        if numerical.fast_is_below_zero(ray_dir.y):
+            step_y = -1
+            side_dist_y = (pos.y - int_map[1]) * delta_dist.y
+        else:
+            step_y = 1
+            side_dist_y = (int_map[1] + 1.0 - pos.y) * delta_dist.y
+        side_dist = [side_dist_x, side_dist_y]
+        step = constants.Point2(step_x, step_y)
+        return step, side_dist, delta_dist
+
+    def hit_wall(int_map, grid) -> bool:
+        """Check if a valid tile has been hit by ray."""
+        return grid[int_map] > 0
+
+    def is_lost(int_map, step, distance, grid, max_distance) -> bool:
+        """Check if the ray can no longer hit a valid tile. Either it is
+        further than <max_distance> or it is outside of the grid and moving away."""
+        if not distance <= max_distance:
+            # also catches nan distances of degenerate rays
+            return True
+        (rows, cols) = grid.shape
+        (x, y) = int_map
+        return (
+            (x < 0 and step.x < 0)
+            or (x >= rows and step.x > 0)
+            or (y < 0 and step.y < 0)
+            or (y >= cols and step.y > 0)
+        )
+
+    def calculate_wall_distance(side_dist, delta_dist, side) -> float:
+        """Calculates euclidean distance of <start> to intersection point.
+        Handles which side of a cube is hit. If no wall is hit returns infinity."""
+        if side == 0:
+            # side is vertical
+            perp_wall_dist = side_dist[0] - delta_dist.x
+        elif side == 1:
+            # side is horizontal
+            perp_wall_dist = side_dist[1] - delta_dist.y
+        else:
+            # side == -1
+            perp_wall_dist = float("inf")
+        return perp_wall_dist
+
+    # grid of integers
+    # start may be floats
+    # get the int values of the start xy
+    int_map = [int(start.x), int(start.y)]
+    (step, side_dist, delta_dist) = construct_deltas(direction_ray, start, int_map)
+    # perform DDA
+    steps = 0
+    while True:
+        steps += 1
+        (side_dist, int_map, side) = walk_along_ray(
+            int_map, step, side_dist, delta_dist
+        )
+        # distance at which the ray entered the current tile
+        distance = calculate_wall_distance(side_dist, delta_dist, side)
+        if is_lost(int_map, step, distance, grid, max_distance):
+            result = (float("inf"), -1, 0, steps)
+            break
+        if hit_wall(int_map, grid):
+            result = (distance, side, grid[int_map], steps)
+            break
+    if PROFILER.enabled:
+        PROFILER.count("rays", 1)
+        PROFILER.count("dda_steps", steps)
+    return result
+
+
+def walk_along_ray(int_map, step, side_dist, delta_dist):
+    """Take a <step> along a given ray by following a <delta_dist>.
+    Returns new <side_dist>, new <int_map>, and <side>."""
+    assert isinstance(int_map, list) and isinstance(
+        side_dist, list
+    ), "Must be a mutable (list) iterable!"
+    if numerical.fast_is_below(side_dist[0], side_dist[1]):
+        # add to our x dist tracker
+        side_dist[0] += delta_dist.x
+        # take a step along x
+        int_map[0] += step.x
+        side = 0
+    else:
+        side_dist[1] += delta_dist.y
+        int_map[1] += step.y
+        side = 1
+    return side_dist, int_map, side
+
+
+def render_columns(
+    framebuffer,
+    origin,
+    direction,
+    plane,
+    grid,
+    step=1,
+    batch=True,
+    start=0,
+    stop=None,
+    palette=None,
+    field=None,
+    cache=None,
+    textures=None,
+    floors=None,
+):
+    """Cast a ray for every <step> column of <framebuffer> from <start> to <stop>
+    (every column by default) and write the walls into it with a single
+    FrameBuffer.draw_columns call. <palette> is passed on to SHADING.refresh
+    and <field> to cast_columns.
+    A column_cache.ColumnCache <cache> reuses the columns of earlier frames.
+    With a textures.TextureCache <textures> the walls are textured and with a
+    floor_caster.FloorCaster <floors> the floor and ceiling are cast as well.
+    Returns the Columns that were drawn."""
+    (width, height) = (framebuffer.width, framebuffer.height)
+    SHADING.refresh(palette)
+    if textures is not None:
+        textures.refresh(palette)
+    if floors is not None:
+        floors.refresh(palette)
+    cast = cast_columns if cache is None else cache.cast_columns
+    columns = cast(
+        origin, direction, plane, grid, width, step, batch, start, stop, field
+    )
+    with PROFILER.stage("draw"):
+        if textures is None:
+            hit = columns.side != -1
+            y_start, y_end = get_y_spans(columns.dist, height)
+            colors = np.zeros((len(columns.dist), 3), dtype=np.uint8)
+            colors[hit] = get_colors(
+                columns.dist[hit], columns.side[hit], columns.element[hit]
+            )
+            framebuffer.draw_columns(y_start, y_end, colors, step, start)
+        else:
+            # the rays again, to find where along the wall they hit
+            (_, ray_x, ray_y) = vectorized.get_rays(
+                direction, plane, width, step, start, stop
+            )
+            (offsets, ids) = textures.sample(origin, ray_x, ray_y, columns, height)
+            with np.errstate(divide="ignore"):
+                line_height = height / columns.dist
+            framebuffer.draw_textures(
+                line_height, textures.slots, offsets, ids, step, start
+            )
+        framebuffer.set_depth(columns.dist, step, start)
+    if floors is not None:
+        with PROFILER.stage("flats"):
+            floors.draw(framebuffer, origin, direction, plane, step, start, stop)
+    return columns
@@ -0,0 +1,102 @@
+"""Precomputed shading of wall, floor and ceiling colors.
+Colors are darkened by side and by the distance falloff 1 - 1/(d+1),
+which only depends on the distance, so every shade is computed once into a
+table indexed by element, side and a quantized distance bucket."""
+import numpy as np
+
+import constants
+
+
+def current_palette() -> tuple:
+    """Snapshot of the colors in constants that the shading depends on."""
+    return (
+        tuple(sorted(constants.INT_TO_COLOR.items())),
+        constants.CEILING,
+        constants.FLOOR,
+    )
+
+
+class ShadingTable:
+    """Lookup table of shaded colors.
+    walls[element, side, bucket] holds the color get_color would return,
+    flats[0 or 1, bucket] holds the shaded ceiling and floor.
+    <levels> sets how many distance buckets are used, more levels means
+    less visible banding but a larger table."""
+
+    SIDE_DARKEN = 50                # vertical sides are darker by this much
+    DISTANCE_DARKEN = 150           # far away colors are darker by up to this much
+
+    def __init__(self, levels=constants.SHADE_LEVELS) -> None:
+        assert levels >= 1, "Shading needs at least one level!"
+        self.levels = levels
+        self.palette = None
+        self.refresh()
+
+    def refresh(self, palette=None) -> bool:
+        """Rebuild the table if the colors in constants changed.
+        <palette> is a current_palette() snapshot to use instead of constants,
+        e.g. one taken in another process.
+        @return bool: True if the table was rebuilt."""
+        if palette is None:
+            palette = current_palette()
+        if palette == self.palette:
+            return False
+        self.palette = palette
+        self.build()
+        return True
+
+    def build(self) -> None:
+        # representative falloff of every bucket
+        ratio = (np.arange(self.levels) + 0.5) / self.levels
+        darken = (ratio * self.DISTANCE_DARKEN)[:, None]
+        (colors, ceiling, floor) = self.palette
+        base = np.zeros((256, 3))
+        for element, color in colors:
+            base[element] = color
+        # sides: 0 is vertical and darker, 1 is horizontal
+        sides = np.stack(
+            [np.clip(base - self.SIDE_DARKEN, 0, 255), base], axis=1
+        )
+        walls = sides[:, :, None, :] - darken
+        self.walls = np.clip(walls, 0, 255).astype(np.uint8)
+        flats = np.array([ceiling, floor], dtype=float)
+        self.flats = np.clip(flats[:, None, :] - darken, 0, 255).astype(np.uint8)
+
+    def bucket(self, distance):
+        """Distance bucket of a distance or an array of distances."""
+        ratio = 1 - (1 / (np.asarray(distance) + 1))
+        return np.minimum((ratio * self.levels).astype(int), self.levels - 1)
+
+    def lookup(self, distance, side, element) -> tuple:
+        """Shaded color of a single wall column."""
+        side = 0 if side == 0 else 1
+        return tuple(self.walls[element, side, self.bucket(distance)].tolist())
+
+    def gather(self, distance, side, element) -> np.ndarray:
+        """Shaded colors of arrays of wall columns.
+        @return (n, 3) uint8 array of colors."""
+        side = (np.asarray(side) != 0).astype(int)
+        return self.walls[element, side, self.bucket(distance)]
+
+    def shade(self, colors, side, bucket) -> np.ndarray:
+        """Shade the (..., 3) <colors> like a wall of <side> in distance
+        <bucket>, e.g. the texels of a texture.
+        @return uint8 array of the same shape."""
+        darken = ((bucket + 0.5) / self.levels) * self.DISTANCE_DARKEN
+        if side == 0:
+            darken += self.SIDE_DARKEN
+        shaded = np.asarray(colors, dtype=float) - darken
+        return np.clip(shaded, 0, 255).astype(np.uint8)
+
+    def dim(self, colors, bucket) -> np.ndarray:
+        """Darken the (..., 3) <colors> for distance <bucket> in proportion to
+        their brightness, the falloff of shade turns the dark floor and
+        ceiling colors black a tile away.
+        @return uint8 array of the same shape."""
+        darken = ((np.asarray(bucket) + 0.5) / self.levels) * self.DISTANCE_DARKEN
+        scale = 1 - darken[..., None] / 255
+        return np.clip(np.asarray(colors, dtype=float) * scale, 0, 255).astype(np.uint8)
+
+    def gather_flat(self, distance, floor=True) -> np.ndarray:
+        """Shaded floor (or ceiling) colors for an array of distances."""
+        return self.flats[int(floor), self.bucket(distance)]
@@ -0,0 +1,235 @@
+"""Wall textures.
+Every grid element maps to a square texture image, constants.TEXTURES names
+the image files and elements without one get a procedural brick texture in
+their color from constants.INT_TO_COLOR.
+Textures are not shaded per pixel while drawing. A TextureCache keeps
+copies of them that are already shaded for a side and a distance bucket and
+pre-scaled (box filtered) for the wall height of that bucket, so far away
+walls do not shimmer. The copies live in a fixed number of slots that are
+reused least recently used first, which bounds the texture memory, and a
+frame is sampled from them with one gather in FrameBuffer.draw_textures.
+"""
+from __future__ import annotations
+
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+import constants
+from framebuffer import pack_rgb
+from shading import ShadingTable, current_palette
+
+
+def procedural(element, size=constants.TEXTURE_SIZE, colors=None) -> np.ndarray:
+    """Brick texture in the color of <element> in <colors>, constants.INT_TO_COLOR
+    by default, the same for every call.
+    @return (size, size, 3) uint8 array indexed [x, y]."""
+    colors = constants.INT_TO_COLOR if colors is None else colors
+    color = np.array(colors.get(element, (128, 128, 128)), dtype=float)
+    (brick_w, brick_h) = (max(size // 2, 1), max(size // 4, 1))
+    (x, y) = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+    row = y // brick_h
+    # every other row of bricks is shifted by half a brick
+    shifted = (x + (row % 2) * (brick_w // 2)) % size
+    brick = row * 2 + shifted // brick_w
+    mortar = (y % brick_h == 0) | (shifted % brick_w == 0)
+    # slightly different brightness per brick
+    rng = np.random.default_rng(element)
+    light = rng.uniform(0.8, 1.0, brick.max() + 1)[brick]
+    texture = color * np.where(mortar, 0.45, light)[..., None]
+    return np.clip(texture, 0, 255).astype(np.uint8)
+
+
+def tiles(color, size=constants.TEXTURE_SIZE, seed=0) -> np.ndarray:
+    """Square tiles of <color>, two per texture side, for floors and ceilings.
+    @return (size, size, 3) uint8 array indexed [x, y]."""
+    tile = max(size // 2, 1)
+    (x, y) = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+    grout = (x % tile == 0) | (y % tile == 0)
+    number = (x // tile) * 2 + y // tile
+    rng = np.random.default_rng(seed)
+    light = rng.uniform(0.85, 1.15, number.max() + 1)[number]
+    texture = np.array(color, dtype=float) * np.where(grout, 0.6, light)[..., None]
+    return np.clip(texture, 0, 255).astype(np.uint8)
+
+
+def load_image(path, size=constants.TEXTURE_SIZE) -> np.ndarray:
+    """Read the image at <path> and resample it to <size> x <size>.
+    @return (size, size, 3) uint8 array indexed [x, y]."""
+    import pygame as pg
+
+    pixels = pg.surfarray.array3d(pg.image.load(path))
+    (width, height) = pixels.shape[:2]
+    xs = np.arange(size) * width // size
+    ys = np.arange(size) * height // size
+    return np.ascontiguousarray(pixels[xs[:, None], ys[None, :]])
+
+
+def texture_image(element, size=constants.TEXTURE_SIZE, colors=None) -> np.ndarray:
+    """Texture of <element>, the procedural one in <colors> if it has no
+    image file or the file cannot be read."""
+    path = constants.TEXTURES.get(element)
+    if path is not None:
+        try:
+            return load_image(path, size)
+        except Exception as error:
+            warnings.warn(f"Texture {path} of element {element}: {error}")
+    return procedural(element, size, colors)
+
+
+def wall_x(origin, ray_x, ray_y, dist, side) -> np.ndarray:
+    """Where along the wall every ray hit it, as a fraction of the tile.
+    The hit point is origin + dist * ray, its y matters for x sides (side 0)
+    and its x for y sides (side 1), like lodev's wallX."""
+    with np.errstate(invalid="ignore"):
+        hit = np.where(side == 0, origin.y + dist * ray_y, origin.x + dist * ray_x)
+    return hit - np.floor(hit)
+
+
+class TextureCache:
+    """Shaded and pre-scaled copies of the wall textures.
+    Every copy is keyed by element, side, distance bucket (one of <levels>)
+    and scale level and kept in one of <capacity> slots of <size> x <size>
+    packed pixels, the least recently used copy is replaced first.
+    <hits>, <misses> and <evictions> count slot lookups."""
+
+    def __init__(
+        self,
+        size=constants.TEXTURE_SIZE,
+        capacity=constants.TEXTURE_SLOTS,
+        levels=constants.TEXTURE_LEVELS,
+    ) -> None:
+        assert size & (size - 1) == 0, "Texture size must be a power of 2!"
+        self.size = size
+        self.scales = size.bit_length()
+        self.shading = ShadingTable(levels)
+        # texture columns between a ceiling and a floor texel
+        self.slots = np.zeros((capacity, size, size + 2), dtype="<u4")
+        self.used = OrderedDict()
+        self.images = {}
+        self.palette = None
+        # changes whenever the textures change, part of every texel id
+        self.generation = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.slots)
+
+    def refresh(self, palette=None) -> bool:
+        """Drop every texture if the colors or texture files in constants changed.
+        <palette> is a shading.current_palette() snapshot to use instead of
+        the colors in constants, like ShadingTable.refresh.
+        @return bool: True if the textures were dropped."""
+        if palette is None:
+            palette = current_palette()
+        palette = (palette, tuple(sorted(constants.TEXTURES.items())))
+        if palette == self.palette:
+            return False
+        self.palette = palette
+        self.images.clear()
+        self.used.clear()
+        self.generation += 1
+        (_, ceiling, floor) = palette[0]
+        self.slots[..., 0] = pack_rgb(ceiling)
+        self.slots[..., -1] = pack_rgb(floor)
+        return True
+
+    def image(self, element) -> np.ndarray:
+        if element not in self.images:
+            colors = dict(self.palette[0][0])
+            self.images[element] = texture_image(element, self.size, colors)
+        return self.images[element]
+
+    def build(self, key) -> np.ndarray:
+        """Packed texture for <key>, see keys."""
+        (element, side, bucket, scale) = key
+        texels = self.image(element).astype(float)
+        if scale:
+            # average blocks of 2^scale texels and stretch them back
+            block = 1 << scale
+            n = self.size // block
+            texels = texels.reshape(n, block, n, block, 3).mean(axis=(1, 3))
+            texels = np.repeat(np.repeat(texels, block, axis=0), block, axis=1)
+        return pack_rgb(self.shading.shade(texels, side, bucket))
+
+    def slot(self, key) -> int:
+        """Slot holding the texture of <key>, built on a miss."""
+        slot = self.used.get(key)
+        if slot is not None:
+            self.hits += 1
+            self.used.move_to_end(key)
+            return slot
+        self.misses += 1
+        if len(self.used) < self.capacity:
+            slot = len(self.used)
+        else:
+            (_, slot) = self.used.popitem(last=False)
+            self.evictions += 1
+        self.slots[slot, :, 1:-1] = self.build(key)
+        self.used[key] = slot
+        return slot
+
+    def grow(self, capacity) -> None:
+        """Add slots so a single frame that needs more than <capacity> fits."""
+        extra = np.empty((capacity - self.capacity, *self.slots.shape[1:]), "<u4")
+        extra[:] = self.slots[0]
+        self.slots = np.concatenate([self.slots, extra])
+
+    def keys(self, distance, side, element, line_height) -> np.ndarray:
+        """Key of the texture copy for every wall column as (n, 4) ints of
+        element, side, distance bucket and scale level. The scale level
+        halves the texture resolution as often as the wall height on screen
+        (<line_height>) is below the texture size."""
+        with np.errstate(divide="ignore"):
+            ratio = self.size / np.maximum(line_height, 1)
+        scale = np.clip(np.floor(np.log2(np.maximum(ratio, 1))), 0, self.scales - 1)
+        return np.stack(
+            [
+                element.astype(int),
+                (side != 0).astype(int),
+                self.shading.bucket(distance),
+                scale.astype(int),
+            ],
+            axis=1,
+        )
+
+    def sample(self, origin, ray_x, ray_y, columns, height):
+        """Texture columns for the walls in <columns> (vectorized.Columns)
+        cast from <origin> along <ray_x>, <ray_y> on a screen <height> rows high.
+        @return (offsets, ids): the index of the first texel of every column
+        in the flat slots and an id that changes whenever the texels of the
+        column change, both 0 for columns without a wall.
+        Call refresh first to pick up palette changes."""
+        if self.palette is None:
+            self.refresh()
+        (dist, side) = (columns.dist, columns.side)
+        hit = side != -1
+        offsets = np.zeros(len(dist), dtype=np.int64)
+        ids = np.zeros(len(dist), dtype=np.int64)
+        if not hit.any():
+            return offsets, ids
+        (dist, side) = (dist[hit], side[hit])
+        (ray_x, ray_y) = (ray_x[hit], ray_y[hit])
+        size = self.size
+        tex_x = (wall_x(origin, ray_x, ray_y, dist, side) * size).astype(int)
+        tex_x = np.minimum(tex_x, size - 1)
+        # mirror the walls seen from the other side, so textures are not flipped
+        flip = ((side == 0) & (ray_x > 0)) | ((side == 1) & (ray_y < 0))
+        tex_x = np.where(flip, size - 1 - tex_x, tex_x)
+        keys = self.keys(dist, side, columns.element[hit], height / dist)
+        (element, side_key, bucket, scale) = keys.T
+        number = ((element * 2 + side_key) * self.shading.levels + bucket) * self.scales
+        number += scale
+        (unique, first, inverse) = np.unique(
+            number, return_index=True, return_inverse=True
+        )
+        if len(unique) > self.capacity:
+            self.grow(len(unique))
+        # the slots of this frame are the most recently used, none is replaced
+        slots = np.array([self.slot(tuple(key)) for key in keys[first].tolist()])
+        offsets[hit] = (slots[inverse] * size + tex_x) * (size + 2)
+        # generation, key number and texture column identify the texels
+        ids[hit] = (self.generation << 32) + number * size + tex_x + 1
+        return offsets, ids
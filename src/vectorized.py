@@ -0,0 +1,208 @@
+"""Vectorized version of the DDA algorithm in main.
+Instead of running run_along_ray once per screen column, every ray is
+advanced in lockstep over a DenseGrid with numpy.
+The stepping rules (including the float tolerances from numerical) match
+run_along_ray and walk_along_ray so both paths produce the same walls.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+import constants
+import numerical
+from profiler import PROFILER
+
+
+# per ray results of a batched cast, each field is an array
+Columns = namedtuple("Columns", "dist side element steps")
+# Columns with the position of the tile that was hit, -1 for misses
+Hits = namedtuple("Hits", "dist side element steps cell_x cell_y")
+
+
+def get_rays(direction, plane, width, step=1, start=0, stop=None):
+    """Construct the ray for every <step> screen column from <start> to <stop>
+    (0 to <width> by default) of a screen <width> columns wide.
+    Returns the screen x coordinates and the x, y components of each ray."""
+    xs = np.arange(start, width if stop is None else stop, step)
+    camera_x = ((2 * xs) / width) - 1
+    ray_x = direction.x + (plane.x * camera_x)
+    ray_y = direction.y + (plane.y * camera_x)
+    return xs, ray_x, ray_y
+
+
+def run_along_rays(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    grid,
+    max_distance=constants.VIEW_DISTANCE,
+    field=None,
+):
+    """Apply the DDA to every ray at once until each one hits a valid tile
+    in <grid>, travels further than <max_distance> or leaves the grid.
+    <origin_x>, <origin_y> and <max_distance> may be scalars or one value per ray.
+    If a DistanceField <field> is given, rays jump over empty squares
+    instead of walking them tile by tile.
+    Rays that never hit a tile are returned with side=-1, dist=inf and element=0.
+    <steps> holds how many DDA steps (walks and jumps) each ray took."""
+    hits = march_rays(origin_x, origin_y, ray_x, ray_y, grid, max_distance, field)
+    PROFILER.count("rays", hits.dist.size)
+    PROFILER.count("dda_steps", int(hits.steps.sum()))
+    return Columns(*hits[:4])
+
+
+def march_rays(
+    origin_x,
+    origin_y,
+    ray_x,
+    ray_y,
+    grid,
+    max_distance=constants.VIEW_DISTANCE,
+    field=None,
+):
+    """run_along_rays that also returns the position of every tile that was hit.
+    Distances are measured in multiples of the ray, so a ray from a to b
+    with max_distance=1 stops at b.
+    @return Hits, cell_x and cell_y are -1 for rays that hit nothing."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ray_x = np.asarray(ray_x, dtype=float)
+        ray_y = np.asarray(ray_y, dtype=float)
+        origin_x = np.broadcast_to(np.asarray(origin_x, dtype=float), ray_x.shape)
+        origin_y = np.broadcast_to(np.asarray(origin_y, dtype=float), ray_y.shape)
+        max_distance = np.broadcast_to(
+            np.asarray(max_distance, dtype=float), ray_x.shape
+        ).ravel()
+        # delta_dist = abs(1/ray_dir.x, 1/ray_dir.y), inf for axis aligned rays
+        delta_x = np.abs(1 / ray_x).ravel()
+        delta_y = np.abs(1 / ray_y).ravel()
+        map_x = origin_x.astype(int).ravel()
+        map_y = origin_y.astype(int).ravel()
+        neg_x = numerical.array_is_below(ray_x, 0).ravel()
+        neg_y = numerical.array_is_below(ray_y, 0).ravel()
+        step_x = np.where(neg_x, -1, 1)
+        step_y = np.where(neg_y, -1, 1)
+        side_x = np.where(
+            neg_x, origin_x.ravel() - map_x, map_x + 1.0 - origin_x.ravel()
+        ) * delta_x
+        side_y = np.where(
+            neg_y, origin_y.ravel() - map_y, map_y + 1.0 - origin_y.ravel()
+        ) * delta_y
+
+    dist = np.full(ray_x.size, np.inf)
+    side = np.full(ray_x.size, -1, dtype=np.int8)
+    element = np.zeros(ray_x.size, dtype=np.int16)
+    steps = np.zeros(ray_x.size, dtype=int)
+    cell_x = np.full(ray_x.size, -1, dtype=int)
+    cell_y = np.full(ray_x.size, -1, dtype=int)
+    (rows, cols) = grid.shape
+    # state of the rays that are still running, compacted as rays finish
+    index = np.arange(ray_x.size)
+    iteration = 0
+    while index.size:
+        iteration += 1
+        if field is not None:
+            (side_x, side_y, map_x, map_y) = _skip_empty(
+                field, side_x, side_y, map_x, map_y, step_x, step_y, delta_x, delta_y
+            )
+        # walk_along_ray for every active ray
+        take_x = numerical.array_is_below(side_x, side_y)
+        with np.errstate(invalid="ignore"):
+            side_x = np.where(take_x, side_x + delta_x, side_x)
+            side_y = np.where(take_x, side_y, side_y + delta_y)
+            # distance at which the ray entered the current tile
+            entry = np.where(take_x, side_x - delta_x, side_y - delta_y)
+        map_x = np.where(take_x, map_x + step_x, map_x)
+        map_y = np.where(take_x, map_y, map_y + step_y)
+        # lost rays are too far (or nan) or outside of the grid and moving away
+        lost = (
+            ~(entry <= max_distance)
+            | ((map_x < 0) & (step_x < 0))
+            | ((map_x >= rows) & (step_x > 0))
+            | ((map_y < 0) & (step_y < 0))
+            | ((map_y >= cols) & (step_y > 0))
+        )
+        # hit_wall, tiles outside of the grid are never hit
+        cell = grid.lookup(map_x, map_y)
+        hit = (cell > 0) & ~lost
+        done = hit | lost
+        if not done.any():
+            continue
+        # calculate_wall_distance for the rays that collided
+        hit_index = index[hit]
+        dist[hit_index] = entry[hit]
+        side[hit_index] = np.where(take_x[hit], 0, 1)
+        element[hit_index] = cell[hit]
+        cell_x[hit_index] = map_x[hit]
+        cell_y[hit_index] = map_y[hit]
+        steps[index[done]] = iteration
+        # drop finished rays
+        keep = ~done
+        index = index[keep]
+        (map_x, map_y, step_x, step_y) = (
+            map_x[keep], map_y[keep], step_x[keep], step_y[keep]
+        )
+        (side_x, side_y, delta_x, delta_y) = (
+            side_x[keep], side_y[keep], delta_x[keep], delta_y[keep]
+        )
+        max_distance = max_distance[keep]
+    shape = ray_x.shape
+    return Hits(
+        *(
+            values.reshape(shape)
+            for values in (dist, side, element, steps, cell_x, cell_y)
+        )
+    )
+
+
+def _skip_empty(field, side_x, side_y, map_x, map_y, step_x, step_y, delta_x, delta_y):
+    """Jump every ray standing on a tile with distance r >= 3 over the
+    empty square around it. All x and y crossings that happen before the ray
+    reaches the last tile row or column of the square are taken at once,
+    so the ray lands on an empty tile with its side distances up to date.
+    The state arrays are owned by run_along_rays and updated in place."""
+    jump = np.flatnonzero(field.lookup(map_x, map_y) >= 3)
+    if not jump.size:
+        return side_x, side_y, map_x, map_y
+    reach = field.lookup(map_x[jump], map_y[jump]) - 1
+    (sx, sy, dx, dy) = (side_x[jump], side_y[jump], delta_x[jump], delta_y[jump])
+    with np.errstate(invalid="ignore"):
+        # distance of the last crossing that stays inside the square
+        limit = np.minimum(sx + (reach - 1) * dx, sy + (reach - 1) * dy)
+        cross_x = np.floor((limit - sx) / dx) + 1
+        cross_y = np.floor((limit - sy) / dy) + 1
+    # nan (inf / inf) and negative counts mean the axis is not crossed
+    cross_x = np.where(cross_x > 0, np.minimum(cross_x, reach), 0).astype(int)
+    cross_y = np.where(cross_y > 0, np.minimum(cross_y, reach), 0).astype(int)
+    with np.errstate(invalid="ignore"):
+        side_x[jump] = np.where(cross_x > 0, sx + cross_x * dx, sx)
+        side_y[jump] = np.where(cross_y > 0, sy + cross_y * dy, sy)
+    map_x[jump] += cross_x * step_x[jump]
+    map_y[jump] += cross_y * step_y[jump]
+    return side_x, side_y, map_x, map_y
+
+
+def cast_columns(
+    origin,
+    direction,
+    plane,
+    grid,
+    width,
+    step=1,
+    max_distance=constants.VIEW_DISTANCE,
+    start=0,
+    stop=None,
+    field=None,
+    backend=None,
+):
+    """Batched counterpart of cast_rays without the drawing.
+    Casts a ray for every <step> taken from <start> to <stop> (0 to <width>
+    by default) from <origin> with <backend>, run_along_rays by default or
+    one of backends.BACKENDS.
+    Returns Columns of perpendicular distance, side, element and steps per ray."""
+    assert step >= 1, "Step must be greater than 0"
+    with PROFILER.stage("ray_setup"):
+        _, ray_x, ray_y = get_rays(direction, plane, width, step, start, stop)
+    run = run_along_rays if backend is None else backend
+    with PROFILER.stage("dda"):
+        return run(origin.x, origin.y, ray_x, ray_y, grid, max_distance, field)
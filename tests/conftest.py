@@ -0,0 +1,5 @@
+"""The modules live flat in src/ and import each other by name."""
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import backends
+import benchmark
+import distance_field
+import grid
+import numerical
+import vectorized
+import visibility
+from dense_grid import DenseGrid
+
+
+@pytest.fixture(scope="module")
+def world():
+    return DenseGrid(grid.GRID)
+
+
+def camera_rays(world, frames=60, width=320):
+    """Rays of the scripted camera path of benchmark.py over <world>."""
+    for origin, direction, plane in benchmark.camera_path(world, frames):
+        (_, ray_x, ray_y) = vectorized.get_rays(direction, plane, width)
+        yield origin, ray_x, ray_y
+
+
+def uncompiled(*args, **kwargs):
+    return backends.run_along_rays_numba(*args, **kwargs, kernel=backends._march_kernel)
+
+
+@pytest.mark.parametrize("name", [*backends.available(), "uncompiled"])
+def test_backends_cast_the_same_walls(world, name):
+    """Walls have to match the python backend exactly, distances within
+    numerical.REL_TOL, and the kernel has to take the steps of numpy."""
+    field = distance_field.for_grid(world)
+    run = uncompiled if name == "uncompiled" else backends.BACKENDS[name]
+    for origin, ray_x, ray_y in camera_rays(world):
+        args = (origin.x, origin.y, ray_x, ray_y, world)
+        columns = run(*args, field=field)
+        reference = backends.run_along_rays_python(*args, field=field)
+        assert (columns.side == reference.side).all()
+        assert (columns.element == reference.element).all()
+        assert numerical.array_is_close(columns.dist, reference.dist).all()
+        if name != "python":
+            numpy = vectorized.run_along_rays(*args, field=field)
+            assert (columns.steps == numpy.steps).all()
+
+
+@pytest.mark.parametrize("name", backends.available())
+def test_march_finds_the_same_tiles(world, name):
+    """backends.march returns the tiles of vectorized.march_rays, also for
+    segments that stop at their end point."""
+    march = backends.march(name)
+    rng = np.random.default_rng(0)
+    (starts, ends) = rng.uniform(0, world.shape[0], (2, 2000, 2))
+    segments = ends - starts
+    for origin, ray_x, ray_y in camera_rays(world, 10):
+        args = (origin.x, origin.y, ray_x, ray_y, world)
+        assert all(
+            (got == want).all()
+            for got, want in zip(march(*args), vectorized.march_rays(*args))
+        )
+    args = (starts[:, 0], starts[:, 1], segments[:, 0], segments[:, 1], world, 1)
+    for got, want in zip(march(*args), vectorized.march_rays(*args)):
+        assert (got == want).all()
+
+
+def test_line_of_sight_backends_agree(world):
+    rng = np.random.default_rng(1)
+    (starts, ends) = rng.uniform(0, world.shape[0], (2, 2000, 2))
+    sights = [
+        visibility.line_of_sight(starts, ends, world, backend=name)
+        for name in backends.available()
+    ]
+    for sight in sights[1:]:
+        assert all((got == want).all() for got, want in zip(sight, sights[0]))
+
+
+def test_unknown_backend():
+    with pytest.raises(AssertionError):
+        backends.get("fortran")
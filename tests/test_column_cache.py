@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import benchmark
+import grid
+import numerical
+import raycaster
+from column_cache import ColumnCache
+from dense_grid import DenseGrid
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_partial_recast_matches_fresh_cast(batch):
+    """Edit random tiles between two casts of the same pose, the cache has to
+    cast the same walls as raycaster.cast_columns. The camera path of seed 2
+    has a ray that the DDA lets enter a tile past its corner."""
+    world = DenseGrid(grid.GRID)
+    rng = np.random.default_rng(2)
+    cache = ColumnCache()
+    for origin, direction, plane in benchmark.camera_path(DenseGrid(grid.GRID), 90, seed=2):
+        cache.cast_columns(origin, direction, plane, world, 320, 1, batch)
+        for _ in range(4):
+            (x, y) = rng.integers(0, world.shape)
+            if (x, y) != (int(origin.x), int(origin.y)):
+                world[(x, y)] = int(rng.integers(0, 4))
+        got = cache.cast_columns(origin, direction, plane, world, 320, 1, batch)
+        want = raycaster.cast_columns(origin, direction, plane, world, 320, 1, batch)
+        assert (got.element == want.element).all()
+        assert numerical.array_is_close(got.dist, want.dist).all()
+    assert cache.partial == 90
@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+import pytest
+
+import numerical
+
+INF = math.inf
+BASE = [0.0, -0.0, 1.0, -1.0, 0.5, 3.0, 1e-9, 123456.789, 1e300, -1e300, 5e-324]
+
+
+def edge_values() -> list:
+    """Values around REL_TOL and ABS_TOL of every base value."""
+    values = [INF, -INF, math.nan, numerical.ABS_TOL, -numerical.ABS_TOL]
+    rel = numerical.REL_TOL
+    for x in BASE:
+        for factor in (1 - rel, 1 + rel, 1 - 2 * rel, 1 + 2 * rel, 1):
+            near = x * factor
+            values += [near, math.nextafter(near, INF), math.nextafter(near, -INF)]
+    for t in (numerical.ABS_TOL, -numerical.ABS_TOL):
+        values += [math.nextafter(t, INF), math.nextafter(t, -INF)]
+    return values
+
+
+VALUES = edge_values()
+PAIRS = [(a, b) for a in VALUES for b in VALUES]
+REFERENCES = [
+    (numerical.is_close, numerical.fast_is_close, numerical.array_is_close),
+    (numerical.is_below, numerical.fast_is_below, numerical.array_is_below),
+    (numerical.is_above, None, numerical.array_is_above),
+    (numerical.is_below_or_eq, None, numerical.array_is_below_or_eq),
+    (numerical.is_above_or_eq, None, numerical.array_is_above_or_eq),
+]
+
+
+@pytest.mark.parametrize(
+    "reference, fast, array", REFERENCES, ids=[r[0].__name__ for r in REFERENCES]
+)
+def test_predicates_match_reference(reference, fast, array):
+    expected = [reference(a, b) for a, b in PAIRS]
+    if fast is not None:
+        got = [fast(a, b) for a, b in PAIRS]
+        bad = [pair for pair, e, g in zip(PAIRS, expected, got) if e != g]
+        assert not bad, f"{fast.__name__} differs from reference: {bad[:5]}"
+    (a, b) = np.array(PAIRS).T
+    got = array(a, b).tolist()
+    bad = [pair for pair, e, g in zip(PAIRS, expected, got) if e != g]
+    assert not bad, f"{array.__name__} differs from reference: {bad[:5]}"
+    # the int 0 switches on the absolute tolerance
+    expected = [reference(a, 0) for a in VALUES]
+    assert array(np.array(VALUES), 0).tolist() == expected
+
+
+def test_fast_is_below_zero():
+    expected = [numerical.is_below(a, 0) for a in VALUES]
+    assert [numerical.fast_is_below_zero(a) for a in VALUES] == expected
+
+
+@pytest.mark.parametrize("inclusive", [True, False])
+def test_array_is_in(inclusive):
+    triples = [(v, lo, hi) for v in VALUES for lo in BASE for hi in BASE]
+    expected = [numerical.is_in(v, lo, hi, inclusive) for v, lo, hi in triples]
+    got = numerical.array_is_in(*np.array(triples).T, inclusive).tolist()
+    assert got == expected